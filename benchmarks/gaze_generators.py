@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+# Screen of the EMIP and Peitek recordings, the Sharafi et al. recordings use 1024x768
+screen_width = 1920
+screen_height = 1080
+
+
+def generate_gaze(number_of_samples, freq=250.0, fixation_duration=250.0, saccade_duration=40.0, blink_rate=0.2,
+				blink_duration=150.0, missing_rate=0.01, noise=5.0, seed=0):
+	"""
+	Generates a deterministic gaze signal of alternating fixations and saccades with blinks and missing samples.
+
+	Parameters:
+		number_of_samples (int): Length of the signal.
+		freq (float): Sampling frequency in Hz.
+		fixation_duration (float): Mean duration of a fixation in ms (exponentially distributed).
+		saccade_duration (float): Mean duration of a saccade in ms (exponentially distributed).
+		blink_rate (float): Blinks per second, during a blink the samples are invalid and the position is 0.
+		blink_duration (float): Duration of a blink in ms.
+		missing_rate (float): Share of single samples that are missing (position 0) and invalid.
+		noise (float): Standard deviation of the gaze position during a fixation in pixels.
+		seed (int): Seed of the random number generator, the same seed gives the same signal.
+
+	Returns:
+		dict: Time (in ms), X, Y (in pixels) and Validity (1 or 0) per sample.
+	"""
+	rng = np.random.default_rng(seed)
+	sample_duration = 1000.0 / freq
+
+	# Alternate fixations and saccades until the signal is long enough
+	x = np.empty(number_of_samples)
+	y = np.empty(number_of_samples)
+	position = 0
+	current = rng.uniform([0, 0], [screen_width, screen_height])
+	while position < number_of_samples:
+		length = max(1, int(rng.exponential(fixation_duration) / sample_duration))
+		end = min(position + length, number_of_samples)
+		x[position:end] = current[0] + rng.normal(0, noise, end - position)
+		y[position:end] = current[1] + rng.normal(0, noise, end - position)
+		position = end
+
+		# The saccade moves linearly to the next fixation
+		target = rng.uniform([0, 0], [screen_width, screen_height])
+		length = max(1, int(rng.exponential(saccade_duration) / sample_duration))
+		end = min(position + length, number_of_samples)
+		steps = np.arange(1, end - position + 1) / length
+		x[position:end] = current[0] + (target[0] - current[0]) * steps
+		y[position:end] = current[1] + (target[1] - current[1]) * steps
+		position = end
+		current = target
+
+	# Blinks and single missing samples are invalid and lie at 0, 0
+	invalid = rng.random(number_of_samples) < missing_rate
+	blink_length = max(1, int(blink_duration / sample_duration))
+	number_of_blinks = rng.poisson(blink_rate * number_of_samples / freq)
+	for start in rng.integers(0, max(1, number_of_samples), number_of_blinks):
+		invalid[start:start + blink_length] = True
+	x[invalid] = 0.0
+	y[invalid] = 0.0
+
+	# The sampling interval jitters slightly like the one of a real eye tracker
+	time = np.cumsum(np.full(number_of_samples, sample_duration) + rng.normal(0, sample_duration * 0.01, number_of_samples))
+
+	return {
+		'Time': time - time[0] if number_of_samples > 0 else time,
+		'X': x,
+		'Y': y,
+		'Validity': (~invalid).astype(np.int8),
+	}
+
+
+def tobii_header(number_of_samples, freq=250.0):
+	# Header of an iView export like the EMIP raw data files, the lines start with ## and are skipped by the parser
+	return [
+		"## [iView]",
+		"## Converted from:\tC:\\iView\\Data\\rawdata.idf",
+		"## Date:\t01.01.2020 10:00:00",
+		"## Version:\tIDF Converter 3.0.20",
+		"## IDF Version:\t9",
+		f"## Sample Rate:\t{int(freq)}",
+		"## Separator Type:\tMsg",
+		"## Trial Count:\t1",
+		"## Uses Plane File:\tFalse",
+		f"## Number of Samples:\t{number_of_samples}",
+		"## Reversed:\tnone",
+		"## [Run]",
+		"## Subject:\tbenchmark",
+		"## Description:\t",
+		"## [Calibration]",
+		"## Calibration Area:\t1920\t1080",
+		"## Calibration Point 0:\tPosition(960;540)",
+		"## [Geometry]",
+		"## Stimulus Dimension [mm]:\t531\t299",
+		"## Head Distance [mm]:\t700",
+		"## [Hardware Setup]",
+		"## [Presentation]",
+		"## Number of Trials:\t1",
+		"##",
+	]
+
+
+def write_tobii_tsv(path, tasks=("rectangle_java.jpg", "vehicle_java.jpg"), samples_per_task=15000, freq=250.0, seed=0, **gaze_options):
+	"""
+	Writes a synthetic Tobii/iView TSV file like the EMIP raw data, with a message before each task.
+	The instruction tasks of the EMIP recordings are added in front so that they are removed like in the real data.
+	"""
+	tasks = ["instruction_calibration.jpg"] + list(tasks)
+	gaze = generate_gaze(samples_per_task * len(tasks), freq, seed=seed, **gaze_options)
+	columns = ['Time', 'Type', 'Trial', 'L Raw X [px]', 'L Raw Y [px]', 'R Raw X [px]', 'R Raw Y [px]', 'L Dia X [px]',
+			'L Validity', 'R Validity', 'L POR X [px]', 'L POR Y [px]', 'R POR X [px]', 'R POR Y [px]']
+
+	# Timestamps in microseconds like the raw data
+	time = (gaze['Time'] * 1000).astype(np.int64) + 1000000000
+	samples = pd.DataFrame({
+		'Time': time,
+		'Type': 'SMP',
+		'Trial': 1,
+		'L Raw X [px]': np.round(gaze['X'], 2),
+		'L Raw Y [px]': np.round(gaze['Y'], 2),
+		'R Raw X [px]': np.round(gaze['X'], 2),
+		'R Raw Y [px]': np.round(gaze['Y'], 2),
+		'L Dia X [px]': 12.0,
+		'L Validity': gaze['Validity'],
+		'R Validity': gaze['Validity'],
+		'L POR X [px]': np.round(gaze['X'], 2),
+		'L POR Y [px]': np.round(gaze['Y'], 2),
+		'R POR X [px]': np.round(gaze['X'], 2),
+		'R POR Y [px]': np.round(gaze['Y'], 2),
+	})
+
+	with open(path, 'w', newline='\n') as f:
+		f.write('\n'.join(tobii_header(len(samples), freq)) + '\n')
+		f.write('\t'.join(columns) + '\n')
+		for index, task in enumerate(tasks):
+			start = index * samples_per_task
+			message = [str(time[start]), 'MSG', '1', f'# Message: {task}'] + [''] * (len(columns) - 4)
+			f.write('\t'.join(message) + '\n')
+			samples[start:start + samples_per_task].to_csv(f, sep='\t', header=False, index=False, lineterminator='\n')
+
+
+def write_sharafi_txt(path, images=5, samples_per_image=3000, seed=0, **gaze_options):
+	"""
+	Writes a synthetic UTF-16 ogama.txt file like the formatted raw data of Sharafi et al.
+	The gaze is recorded on a 1024x768 screen at 60 Hz.
+	"""
+	gaze = generate_gaze(samples_per_image * images, freq=60.0, seed=seed, **gaze_options)
+	included = gaze['Validity'] == 1
+	df = pd.DataFrame({
+		'SubjectName': 'S1',
+		' ImageName': [f' {image + 1}.PNG' for image in range(images) for _ in range(samples_per_image)],
+		' X': gaze['X'] * 1024 / screen_width,
+		' Y': gaze['Y'] * 768 / screen_height,
+		' StartTime': np.round(gaze['Time']).astype(np.int64),
+		' Duration': 16,
+		' Included?': np.where(included, 'Y', 'N'),
+		' StimulusType': 'Code',
+	})
+	df.to_csv(path, index=False, encoding='utf-16')
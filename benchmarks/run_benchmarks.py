@@ -0,0 +1,192 @@
+"""
+Times the stages of the eye tracking pipelines on synthetic data.
+
+Usage (from the repository root):
+	python benchmarks/run_benchmarks.py --samples 150000 --save-baseline benchmarks/baseline.json
+	python benchmarks/run_benchmarks.py --samples 150000 --compare benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import platform
+import tempfile
+import sqlite3
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gaze_generators import generate_gaze, write_tobii_tsv, write_sharafi_txt
+from utils import cache
+from utils import ogama
+from utils.recordings import parse_tobii_recording, parse_sharafi_recording, load_tobii_recording
+from utils.peitek import to_display_coordinates, unused_columns
+from utils.pygazehelper.corrected_pygaze_functions import fixation_detection_fixed, saccade_detection_fixed
+from utils.pygazehelper.pygaze import load_tobii_segments, fixation_data_analysis
+
+
+def create_ogama_database(path):
+	# The tables of an Ogama experiment database that the imports write to
+	conn = sqlite3.connect(path)
+	conn.execute("CREATE TABLE Subjects ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL, [SubjectName] varchar(50) NOT NULL UNIQUE, [Category] varchar(50), [Age] integer, [Sex] varchar(50), [Handedness] varchar(50), [Comments] text)")
+	conn.execute("CREATE TABLE Trials ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL, [SubjectName] varchar(50) NOT NULL, [TrialID] integer NOT NULL, [TrialName] varchar(50), [TrialSequence] integer NOT NULL, [Category] varchar(50), [TrialStartTime] integer, [Duration] integer, [EliminateData] varchar(50))")
+	conn.commit()
+	conn.close()
+
+
+def peitek_eyetracking(number_of_samples, seed=0):
+	# Eye tracking data like a Peitek trial: normalized display coordinates and validity of both eyes
+	gaze = generate_gaze(number_of_samples, seed=seed)
+	df = pd.DataFrame({'time': 1600000000.0 + gaze['Time'] / 1000.0})
+	for eye in ['l', 'r']:
+		df[eye + '_display_x'] = np.where(gaze['Validity'] == 1, gaze['X'] / 1920.0, np.nan)
+		df[eye + '_display_y'] = np.where(gaze['Validity'] == 1, gaze['Y'] / 1080.0, np.nan)
+		df[eye + '_valid'] = gaze['Validity']
+	for column in unused_columns:
+		df[column] = 0.0
+	return df
+
+
+def define_stages(directory, samples):
+	"""Returns (name, number of processed samples, function) for each stage, the functions only read the prepared files"""
+	tobii_file = os.path.join(directory, 'emip', '1_rawdata.tsv')
+	sharafi_file = os.path.join(directory, 'sharafi', '151', 'ogama.txt')
+
+	gaze = generate_gaze(samples, seed=1)
+	peitek = peitek_eyetracking(samples, seed=2)
+	sharafi_samples = len(parse_sharafi_recording(sharafi_file)['X'])
+
+	def aggregate_fixations():
+		# fixation_data_analysis prints where it saved the results
+		with contextlib.redirect_stdout(None):
+			fixation_data_analysis(os.path.join(directory, 'emip'), os.path.join(directory, 'fixations.csv'))
+
+	def import_emip():
+		database = os.path.join(directory, 'ogama.db')
+		if os.path.exists(database):
+			os.remove(database)
+		create_ogama_database(database)
+		ogama.import_data_into_ogama_emip(tobii_file, 'S1', database)
+
+	return [
+		('parse_tobii', samples, lambda: parse_tobii_recording(tobii_file)),
+		('parse_sharafi', sharafi_samples, lambda: parse_sharafi_recording(sharafi_file)),
+		('segment_tobii', samples, lambda: load_tobii_segments(os.path.dirname(tobii_file), os.path.basename(tobii_file))),
+		('detect_fixations', samples, lambda: fixation_detection_fixed(gaze['X'], gaze['Y'], gaze['Time'])),
+		('detect_saccades', samples, lambda: saccade_detection_fixed(gaze['X'], gaze['Y'], gaze['Time'])),
+		('peitek_transform', samples, lambda: to_display_coordinates(peitek)),
+		('aggregate_fixations', samples, aggregate_fixations),
+		('sqlite_insert_emip', samples, import_emip),
+	]
+
+
+def measure(fn, repeat):
+	# Best time of several runs, and the peak of the memory allocated by Python and numpy in a separate run
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - start)
+
+	tracemalloc.start()
+	fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return min(times), peak
+
+
+def run_benchmarks(samples=150000, repeat=3, stages=None):
+	"""
+	Runs the benchmark stages on synthetic recordings with the given number of samples.
+
+	Returns:
+		dict: Meta data of the run and per stage the seconds, samples per second and peak memory.
+	"""
+	results = {
+		'meta': {
+			'samples': samples,
+			'repeat': repeat,
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'pandas': pd.__version__,
+			'machine': platform.machine(),
+		},
+		'stages': {},
+	}
+
+	with tempfile.TemporaryDirectory() as directory:
+		# Synthetic recordings, the Tobii file has two tasks and the instruction in front of them
+		os.makedirs(os.path.join(directory, 'emip'))
+		os.makedirs(os.path.join(directory, 'sharafi', '151'))
+		write_tobii_tsv(os.path.join(directory, 'emip', '1_rawdata.tsv'), samples_per_task=samples // 3, seed=0)
+		write_sharafi_txt(os.path.join(directory, 'sharafi', '151', 'ogama.txt'), samples_per_image=max(1, samples // 25), seed=0)
+
+		# Keep the parsed recordings in the temporary directory and parse them once, the parse stages do not use the cache
+		cache.cache_directory = os.path.join(directory, '.cache')
+		load_tobii_recording(os.path.join(directory, 'emip', '1_rawdata.tsv'))
+
+		for name, number_of_samples, fn in define_stages(directory, samples):
+			if stages is not None and name not in stages:
+				continue
+			seconds, peak = measure(fn, repeat)
+			results['stages'][name] = {
+				'seconds': seconds,
+				'samples': number_of_samples,
+				'samples_per_second': number_of_samples / seconds if seconds > 0 else float('inf'),
+				'peak_memory_mb': peak / 2**20,
+			}
+			print(f"{name:<22}{seconds:>10.4f} s{number_of_samples / seconds if seconds > 0 else 0:>16,.0f} samples/s{peak / 2**20:>10.1f} MB")
+
+		cache.cache_directory = None
+
+	return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+	"""Prints the change of each stage against the baseline and returns the stages that got slower than the tolerance"""
+	regressions = []
+	for name, stage in results['stages'].items():
+		if name not in baseline['stages']:
+			continue
+		ratio = stage['seconds'] / baseline['stages'][name]['seconds']
+		memory_ratio = stage['peak_memory_mb'] / max(baseline['stages'][name]['peak_memory_mb'], 1e-9)
+		slower = ratio > 1 + tolerance
+		if slower:
+			regressions.append(name)
+		print(f"{name:<22}{ratio:>8.2f}x time{memory_ratio:>8.2f}x memory{'  REGRESSION' if slower else ''}")
+	return regressions
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--samples', type=int, default=150000, help='samples per recording (150000 are 10 minutes at 250 Hz)')
+	parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the fastest one is reported')
+	parser.add_argument('--stages', nargs='*', help='only run these stages')
+	parser.add_argument('--save-baseline', help='write the results to this JSON file')
+	parser.add_argument('--compare', help='compare the results to this baseline JSON file')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline (0.2 = 20%%)')
+	args = parser.parse_args()
+
+	# The detection functions divide by zero for samples with the same timestamp, like on the real data
+	warnings.simplefilter('ignore', RuntimeWarning)
+
+	results = run_benchmarks(args.samples, args.repeat, args.stages)
+
+	if args.save_baseline:
+		with open(args.save_baseline, 'w') as f:
+			json.dump(results, f, indent=2)
+		print(f"Baseline saved to {args.save_baseline}")
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		if baseline['meta']['samples'] != results['meta']['samples']:
+			print(f"The baseline was measured with {baseline['meta']['samples']} samples")
+		if len(compare_to_baseline(results, baseline, args.tolerance)) > 0:
+			sys.exit(1)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the utils folder like the notebooks and benchmarks do
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,154 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.pygazehelper.corrected_pygaze_functions import fixation_detection_fixed, fixation_detection_fixed_reference, StreamingFixationDetector
+
+
+def random_trace(seed, number_of_segments=60, missing_rate=0.05, nan_rate=0.01, zero_rate=0.01):
+	"""
+	Generates a gaze trace of fixations of random length (also shorter than mindur) and single outliers.
+
+	Returns:
+		tuple: x, y and time as pandas Series like the recordings passed to the detection.
+	"""
+	rng = np.random.default_rng(seed)
+	xs = []
+	ys = []
+	for _ in range(number_of_segments):
+		length = int(rng.integers(1, 40))
+		center = rng.uniform(0, 1920), rng.uniform(0, 1080)
+		spread = rng.uniform(0, 20)
+		xs.append(center[0] + rng.normal(0, spread, length))
+		ys.append(center[1] + rng.normal(0, spread, length))
+	x = np.concatenate(xs)
+	y = np.concatenate(ys)
+	time = np.cumsum(rng.integers(1, 9, len(x))).astype(np.float64)
+
+	# missing samples have both coordinates at the missing value, a single 0 or NaN is not missing
+	missing = rng.random(len(x)) < missing_rate
+	x[missing] = 0.0
+	y[missing] = 0.0
+	x[rng.random(len(x)) < nan_rate] = np.nan
+	y[rng.random(len(x)) < nan_rate] = np.nan
+	x[rng.random(len(x)) < zero_rate] = 0.0
+	y[rng.random(len(x)) < zero_rate] = 0.0
+	return pd.Series(x), pd.Series(y), pd.Series(time)
+
+
+def assert_same_fixations(x, y, time, **kwargs):
+	Sfix, Efix = fixation_detection_fixed(x, y, time, **kwargs)
+	Sfix_reference, Efix_reference = fixation_detection_fixed_reference(x, y, time, **kwargs)
+	# NaN positions are compared as equal
+	np.testing.assert_array_equal(np.array(Sfix, dtype=np.float64), np.array(Sfix_reference, dtype=np.float64))
+	np.testing.assert_array_equal(np.array(Efix, dtype=np.float64), np.array(Efix_reference, dtype=np.float64))
+	return Efix
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("maxdist, mindur", [(25, 50), (10, 20), (60, 100)])
+def test_random_traces(seed, maxdist, mindur):
+	x, y, time = random_trace(seed)
+	assert_same_fixations(x, y, time, maxdist=maxdist, mindur=mindur)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_many_missing_samples(seed):
+	x, y, time = random_trace(seed, missing_rate=0.5, nan_rate=0.1, zero_rate=0.1)
+	assert_same_fixations(x, y, time)
+
+
+def test_numpy_arrays():
+	# the vectorized engine also takes arrays, the reference needs Series
+	x, y, time = random_trace(0)
+	Sfix, Efix = fixation_detection_fixed(x.to_numpy(), y.to_numpy(), time.to_numpy())
+	Sfix_reference, Efix_reference = fixation_detection_fixed_reference(x, y, time)
+	np.testing.assert_array_equal(np.array(Efix, dtype=np.float64), np.array(Efix_reference, dtype=np.float64))
+
+
+def test_short_fixation_is_dropped():
+	# 5 samples 10 ms apart are a fixation of 40 ms, the jump ends it
+	x = pd.Series([100.0, 100, 101, 100, 101, 500, 900])
+	y = pd.Series([100.0, 100, 100, 101, 101, 500, 900])
+	time = pd.Series(np.arange(7) * 10.0)
+	assert assert_same_fixations(x, y, time, mindur=50) == []
+	assert len(assert_same_fixations(x, y, time, mindur=30)) == 1
+
+
+def test_fixation_at_trace_end():
+	# the last fixation has no sample that ends it, it ends with the trace
+	x = pd.Series([100.0, 500, 501, 502, 501])
+	y = pd.Series([100.0, 500, 500, 501, 501])
+	time = pd.Series([0.0, 10, 20, 30, 40])
+	assert assert_same_fixations(x, y, time, mindur=100) == [[20.0, 40.0, 20.0, 501.0, 500.0]]
+
+
+def test_missing_samples_are_skipped():
+	x = pd.Series([100.0, 0, 101, 0, 100, 102])
+	y = pd.Series([100.0, 0, 100, 0, 101, 0])
+	time = pd.Series([0.0, 10, 20, 30, 40, 50])
+	# the sample at 50 ms has only y at 0 and is not missing, it ends the fixation
+	assert assert_same_fixations(x, y, time, mindur=10) == [[20.0, 40.0, 20.0, 101.0, 100.0]]
+
+
+@pytest.mark.parametrize("length", range(4))
+def test_short_traces(length):
+	x, y, time = random_trace(1)
+	assert_same_fixations(x[:length], y[:length], time[:length])
+	assert_same_fixations(pd.Series(np.zeros(length)), pd.Series(np.zeros(length)), time[:length])
+
+
+def stream_fixations(detector, x, y, time, chunk_sizes):
+	# Pushes the samples in chunks of the given sizes (repeated), then flushes the detector
+	Efix = []
+	start = 0
+	for size in itertools.cycle(chunk_sizes):
+		if start >= len(x):
+			break
+		Efix += detector.push(x[start:start + size], y[start:start + size], time[start:start + size])
+		start += size
+	return Efix + detector.flush()
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("chunk_sizes", [[1], [7], [1, 50, 3, 200]])
+def test_streaming_equals_batch(seed, chunk_sizes):
+	x, y, time = (values.to_numpy() for values in random_trace(seed))
+	Sfix, Efix = fixation_detection_fixed(x, y, time, maxdist=25, mindur=50)
+	streamed = stream_fixations(StreamingFixationDetector(maxdist=25, mindur=50), x, y, time, chunk_sizes)
+	np.testing.assert_array_equal(np.array(streamed, dtype=np.float64), np.array(Efix, dtype=np.float64))
+
+
+def test_streaming_single_samples():
+	# push also takes single values instead of arrays
+	x, y, time = (values.to_numpy() for values in random_trace(3))
+	detector = StreamingFixationDetector()
+	streamed = []
+	for sx, sy, st in zip(x.tolist(), y.tolist(), time.tolist()):
+		streamed += detector.push(sx, sy, st)
+	streamed += detector.flush()
+	np.testing.assert_array_equal(np.array(streamed, dtype=np.float64), np.array(fixation_detection_fixed(x, y, time)[1], dtype=np.float64))
+
+
+def test_streaming_flush_and_reset():
+	x, y, time = (values.to_numpy() for values in random_trace(4))
+	Efix = np.array(fixation_detection_fixed(x, y, time)[1], dtype=np.float64)
+	detector = StreamingFixationDetector()
+
+	# flush returns the open fixation at the end of the data and resets the detector
+	np.testing.assert_array_equal(np.array(stream_fixations(detector, x, y, time, [100]), dtype=np.float64), Efix)
+	assert detector.flush() == []
+	np.testing.assert_array_equal(np.array(stream_fixations(detector, x, y, time, [100]), dtype=np.float64), Efix)
+
+	# reset forgets the samples of an interrupted stream
+	detector.push(x[:100], y[:100], time[:100])
+	detector.reset()
+	np.testing.assert_array_equal(np.array(stream_fixations(detector, x, y, time, [100]), dtype=np.float64), Efix)
+
+
+def test_streaming_fixation_at_end():
+	detector = StreamingFixationDetector(mindur=100)
+	assert detector.push(np.array([100.0, 500, 501, 502, 501]), np.array([100.0, 500, 500, 501, 501]), np.array([0.0, 10, 20, 30, 40])) == []
+	# the fixation at the end is returned even though it is shorter than mindur, like in fixation_detection_fixed
+	assert detector.flush() == [[20.0, 40.0, 20.0, 501.0, 500.0]]
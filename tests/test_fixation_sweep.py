@@ -0,0 +1,48 @@
+import os
+import pandas as pd
+
+from benchmarks.gaze_generators import write_tobii_tsv
+from utils.pygazehelper.pygaze import fixation_data_analysis, fixation_data_sweep
+
+parameter_sets = [{'missing': 0.0, 'maxdist': 15, 'mindur': 35}, {'missing': 0.0, 'maxdist': 35, 'mindur': 80}]
+
+
+def write_recordings(directory):
+	os.makedirs(directory)
+	for participant in [1, 2]:
+		write_tobii_tsv(os.path.join(directory, f"{participant}_rawdata.tsv"), samples_per_task=2000, seed=participant)
+
+
+def test_sweep_files_equal_single_runs(tmp_path):
+	directory = str(tmp_path / "rawdata")
+	write_recordings(directory)
+	sweep_files = [str(tmp_path / f"sweep_{index}.csv") for index in range(len(parameter_sets))]
+	fixation_data_sweep(directory, parameter_sets, sweep_files)
+
+	for parameters, sweep_file in zip(parameter_sets, sweep_files):
+		single_file = str(tmp_path / "single.csv")
+		fixation_data_analysis(directory, single_file, parameters)
+		with open(sweep_file) as sweep, open(single_file) as single:
+			assert sweep.read() == single.read()
+
+
+def test_sweep_marks_default_parameter_rows(tmp_path):
+	directory = str(tmp_path / "rawdata")
+	write_recordings(directory)
+	sweep_df = fixation_data_sweep(directory, parameter_sets, str(tmp_path / "sweep.csv"))
+	assert list(pd.read_csv(str(tmp_path / "sweep.csv")).columns) == list(sweep_df.columns)
+	assert list(sweep_df.columns[:4]) == ['missing', 'maxdist', 'mindur', 'Default Parameters']
+
+	# The last task of each recording is analysed with the default parameters, the other tasks with the parameter set
+	last_tasks = sweep_df['Task'] == 'vehicle_java.jpg'
+	assert (sweep_df['Default Parameters'] == last_tasks).all()
+	assert (sweep_df.loc[last_tasks, ['maxdist', 'mindur']] == [25, 50]).all().all()
+	for parameters in parameter_sets:
+		rows = sweep_df[~last_tasks & (sweep_df['maxdist'] == parameters['maxdist'])]
+		assert len(rows) == 2 and (rows['mindur'] == parameters['mindur']).all()
+
+	# The rows of each parameter set follow each other, both sets give the same results for the last tasks
+	rows_per_set = len(sweep_df) // len(parameter_sets)
+	first_set = sweep_df[:rows_per_set][last_tasks[:rows_per_set]].reset_index(drop=True)
+	second_set = sweep_df[rows_per_set:][last_tasks[rows_per_set:]].reset_index(drop=True)
+	assert first_set.equals(second_set)
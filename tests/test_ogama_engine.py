@@ -0,0 +1,137 @@
+import sqlite3
+import numpy as np
+import pytest
+
+from utils import ogama
+from utils.ogama_engine import detect_fixations_ogama, write_gaze_fixations, calculate_fixations
+
+
+def hand_built_trace():
+	"""
+	Returns time, x and y of a trial with a sample every 10 ms and the fixations expected for the default parameters.
+
+	- 0 to 80 ms: fixation around (100, 100), the single outlier at 60 ms does not split it
+	- 90 to 130 ms: fixation at (800, 400), the candidate ends the first fixation with its fifth sample
+	- 140 to 170 ms: four missing samples end the second fixation
+	- 180 to 200 ms: three samples at (300, 300) are too few for a fixation
+	- 210 ms: a sample outside of the screen is missing
+	- 220 to 260 ms: fixation at (1000, 900), it ends with the trial
+	"""
+	samples = [(100, 100), (102, 100), (98, 100), (100, 100), (101, 100), (99, 100), (500, 500), (100, 100), (100, 100)]
+	samples += [(800, 400)] * 5
+	samples += [(np.nan, np.nan)] * 4
+	samples += [(300, 300)] * 3
+	samples += [(-5, 300)]
+	samples += [(1000, 900)] * 5
+	samples = np.array(samples, dtype=np.float64)
+	time = np.arange(len(samples)) * 10.0
+	expected = [(0.0, 80.0, 100.0, 100.0), (90.0, 40.0, 800.0, 400.0), (220.0, 40.0, 1000.0, 900.0)]
+	return time, samples[:, 0], samples[:, 1], expected
+
+
+def test_hand_built_trace():
+	time, x, y, expected = hand_built_trace()
+	assert detect_fixations_ogama(time, x, y) == expected
+
+
+def test_parameters():
+	time, x, y, expected = hand_built_trace()
+	# with three samples the short fixation is kept
+	assert detect_fixations_ogama(time, x, y, min_samples=3) == [(0.0, 80.0, 100.0, 100.0), (90.0, 40.0, 800.0, 400.0), (180.0, 20.0, 300.0, 300.0), (220.0, 40.0, 1000.0, 900.0)]
+	# with a large distance only the missing samples split the trial, the sample outside of the screen is kept without screen
+	assert detect_fixations_ogama(time, x, y, max_distance=2000, screen=None) == [(0.0, 130.0, 378.57142857142856, 235.71428571428572), (180.0, 80.0, 655.0, 633.3333333333334)]
+	assert detect_fixations_ogama(time[:0], x[:0], y[:0]) == []
+
+
+@pytest.mark.parametrize("gap, expected", [
+	(3, [(0.0, 120.0, 500.0, 500.0)]),
+	(4, [(0.0, 40.0, 500.0, 500.0), (90.0, 40.0, 500.0, 500.0)]),
+])
+def test_missing_samples_within_fixation(gap, expected):
+	# up to max_missed missing samples in a row do not end a fixation
+	x = np.array([500.0] * 5 + [np.nan] * gap + [500.0] * 5)
+	time = np.arange(len(x)) * 10.0
+	assert detect_fixations_ogama(time, x, x.copy()) == expected
+
+
+def create_database(path, subjects):
+	# The tables of an Ogama experiment database that the import and the fixation calculation use
+	conn = sqlite3.connect(path)
+	c = conn.cursor()
+	c.execute("CREATE TABLE Subjects ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL, [SubjectName] varchar(50) NOT NULL UNIQUE, [Category] varchar(50), [Age] integer, [Sex] varchar(50), [Handedness] varchar(50), [Comments] text)")
+	c.execute("CREATE TABLE Trials ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL, [SubjectName] varchar(50) NOT NULL, [TrialID] integer NOT NULL, [TrialName] varchar(50), [TrialSequence] integer NOT NULL, [Category] varchar(50), [TrialStartTime] integer, [Duration] integer, [EliminateData] varchar(50))")
+	for subject in subjects:
+		c.execute("INSERT INTO Subjects (SubjectName) VALUES (?)", (subject,))
+		ogama.create_rawdata_table(c, subject)
+	conn.commit()
+	return conn
+
+
+def read_gaze_fixations(path):
+	conn = sqlite3.connect(path)
+	rows = conn.execute("SELECT SubjectName, TrialID, TrialSequence, CountInTrial, StartTime, Length, PosX, PosY FROM GazeFixations ORDER BY ID").fetchall()
+	conn.close()
+	return rows
+
+
+@pytest.mark.parametrize("single_rawdata_table", [False, True])
+def test_calculate_fixations_round_trip(tmp_path, monkeypatch, single_rawdata_table):
+	monkeypatch.setattr(ogama, "single_rawdata_table", single_rawdata_table)
+	path = str(tmp_path / "experiment.db")
+	conn = create_database(path, ["S1", "S2"])
+	c = conn.cursor()
+
+	# Two trials of S1 and one of S2, the time of the samples is relative to the start of the recording
+	time, x, y, expected = hand_built_trace()
+	trials = [("S1", 11, 1, 1000), ("S1", 12, 2, 5000), ("S2", 11, 1, 0)]
+	for subject, trial_id, trial_sequence, trial_start_time in trials:
+		c.execute("INSERT INTO Trials (SubjectName, TrialID, TrialName, TrialSequence, Category, TrialStartTime, Duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+				(subject, trial_id, str(trial_id), trial_sequence, "", trial_start_time, 260))
+		ogama.insert_raw_data(c, subject, trial_sequence, time + trial_start_time, x, y)
+	conn.commit()
+	conn.close()
+
+	calculate_fixations(path)
+
+	expected_rows = []
+	for subject, trial_id, trial_sequence, _ in trials:
+		for count_in_trial, (start_time, length, fixation_x, fixation_y) in enumerate(expected, start=1):
+			expected_rows.append((subject, trial_id, trial_sequence, count_in_trial, int(start_time), int(length), fixation_x, fixation_y))
+	assert read_gaze_fixations(path) == expected_rows
+
+	# Calculating the fixations of a subject again replaces its rows
+	calculate_fixations(path, subjects=["S1"])
+	assert sorted(read_gaze_fixations(path)) == sorted(expected_rows)
+
+
+def test_write_gaze_fixations(tmp_path):
+	path = str(tmp_path / "experiment.db")
+	conn = sqlite3.connect(path)
+	c = conn.cursor()
+
+	# The table is created if it does not exist, the rows of other subjects are kept
+	write_gaze_fixations(c, "S1", [("S1", 1, 1, 1, 0, 100, 10.0, 20.0)])
+	write_gaze_fixations(c, "S2", [("S2", 1, 1, 1, 50, 200, 30.0, 40.0), ("S2", 1, 1, 2, 300, 100, 50.0, 60.0)])
+	write_gaze_fixations(c, "S1", [("S1", 2, 2, 1, 10, 80, 70.0, 80.0)])
+	conn.commit()
+	conn.close()
+
+	assert sorted(read_gaze_fixations(path)) == [("S1", 2, 2, 1, 10, 80, 70.0, 80.0), ("S2", 1, 1, 1, 50, 200, 30.0, 40.0), ("S2", 1, 1, 2, 300, 100, 50.0, 60.0)]
+
+
+def test_calculate_fixations_keeps_wal_mode(tmp_path):
+	# The import settings must not switch a WAL database to another journal mode
+	path = str(tmp_path / "experiment.db")
+	conn = create_database(path, ["S1"])
+	conn.execute("PRAGMA journal_mode = WAL")
+	time, x, y, expected = hand_built_trace()
+	ogama.insert_raw_data(conn.cursor(), "S1", 1, time, x, y)
+	conn.commit()
+	conn.close()
+
+	calculate_fixations(path)
+
+	conn = sqlite3.connect(path)
+	assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+	conn.close()
+	assert len(read_gaze_fixations(path)) == len(expected)
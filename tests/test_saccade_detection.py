@@ -0,0 +1,147 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.pygazehelper.corrected_pygaze_functions import saccade_detection_fixed, saccade_detection_fixed_reference, StreamingSaccadeDetector
+
+
+def random_trace(seed, number_of_segments=60, missing_rate=0.05, nan_rate=0.01):
+	"""
+	Generates a gaze trace of still segments (below the velocity threshold), noisy segments and jumps.
+
+	Returns:
+		tuple: x, y and time as pandas Series like the recordings passed to the detection.
+	"""
+	rng = np.random.default_rng(seed)
+	xs = []
+	ys = []
+	for _ in range(number_of_segments):
+		length = int(rng.integers(1, 30))
+		center = rng.uniform(0, 1920), rng.uniform(0, 1080)
+		# with 1 to 8 ms between samples, a drift of 0.01 pixels stays below 40 pixels/second
+		spread = rng.choice([0.0, 0.01, 0.5, 5.0])
+		xs.append(center[0] + rng.normal(0, spread, length))
+		ys.append(center[1] + rng.normal(0, spread, length))
+	x = np.concatenate(xs)
+	y = np.concatenate(ys)
+	time = np.cumsum(rng.integers(1, 9, len(x))).astype(np.float64)
+
+	missing = rng.random(len(x)) < missing_rate
+	x[missing] = 0.0
+	y[missing] = 0.0
+	x[rng.random(len(x)) < nan_rate] = np.nan
+	return pd.Series(x), pd.Series(y), pd.Series(time)
+
+
+def assert_same_saccades(x, y, time, **kwargs):
+	Ssac, Esac = saccade_detection_fixed(x, y, time, **kwargs)
+	Ssac_reference, Esac_reference = saccade_detection_fixed_reference(x, y, time, **kwargs)
+	# NaN positions are compared as equal
+	np.testing.assert_array_equal(np.array(Ssac, dtype=np.float64), np.array(Ssac_reference, dtype=np.float64))
+	np.testing.assert_array_equal(np.array(Esac, dtype=np.float64), np.array(Esac_reference, dtype=np.float64))
+	return Ssac, Esac
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("minlen, maxvel, maxacc", [(5, 40, 340), (20, 100, 1000), (0, 1000, 100000)])
+def test_random_traces(seed, minlen, maxvel, maxacc):
+	x, y, time = random_trace(seed)
+	assert_same_saccades(x, y, time, minlen=minlen, maxvel=maxvel, maxacc=maxacc)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("seed", range(10))
+def test_many_missing_samples(seed):
+	x, y, time = random_trace(seed, missing_rate=0.5, nan_rate=0.1)
+	assert_same_saccades(x, y, time)
+
+
+def test_saccade_between_still_samples():
+	x = pd.Series([100.0, 100, 100, 100, 300, 500, 500, 500, 500, 500, 500])
+	y = pd.Series(np.full(11, 100.0))
+	time = pd.Series(np.arange(11) * 10.0)
+	Ssac, Esac = assert_same_saccades(x, y, time)
+	assert len(Esac) == 1
+
+
+def test_saccade_at_trace_end():
+	# the saccade does not end before the trace, only its start is returned
+	x = pd.Series([100.0, 100, 100, 100, 300, 500, 700])
+	y = pd.Series(np.full(7, 100.0))
+	time = pd.Series(np.arange(7) * 10.0)
+	Ssac, Esac = assert_same_saccades(x, y, time)
+	assert len(Ssac) == 1 and Esac == []
+
+
+def stream_saccades(detector, x, y, time, chunk_sizes):
+	# Pushes the samples in chunks of the given sizes (repeated), then flushes the detector
+	Ssac = []
+	Esac = []
+	start = 0
+	for size in itertools.cycle(chunk_sizes):
+		if start >= len(x):
+			break
+		pushed = detector.push(x[start:start + size], y[start:start + size], time[start:start + size])
+		Ssac += pushed[0]
+		Esac += pushed[1]
+		start += size
+	flushed = detector.flush()
+	return Ssac + flushed[0], Esac + flushed[1]
+
+
+def assert_same_stream(streamed, x, y, time, **kwargs):
+	Ssac, Esac = saccade_detection_fixed(x, y, time, **kwargs)
+	np.testing.assert_array_equal(np.array(streamed[0], dtype=np.float64), np.array(Ssac, dtype=np.float64))
+	np.testing.assert_array_equal(np.array(streamed[1], dtype=np.float64), np.array(Esac, dtype=np.float64))
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("chunk_sizes", [[1], [7], [1, 50, 3, 200]])
+@pytest.mark.parametrize("minlen, maxvel, maxacc", [(5, 40, 340), (20, 100, 1000)])
+def test_streaming_equals_batch(seed, chunk_sizes, minlen, maxvel, maxacc):
+	x, y, time = (values.to_numpy() for values in random_trace(seed))
+	detector = StreamingSaccadeDetector(minlen=minlen, maxvel=maxvel, maxacc=maxacc)
+	streamed = stream_saccades(detector, x, y, time, chunk_sizes)
+	assert_same_stream(streamed, x, y, time, minlen=minlen, maxvel=maxvel, maxacc=maxacc)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_streaming_single_samples():
+	# push also takes single values instead of arrays
+	x, y, time = (values.to_numpy() for values in random_trace(3))
+	detector = StreamingSaccadeDetector()
+	Ssac = []
+	Esac = []
+	for sx, sy, st in zip(x.tolist(), y.tolist(), time.tolist()):
+		pushed = detector.push(sx, sy, st)
+		Ssac += pushed[0]
+		Esac += pushed[1]
+	flushed = detector.flush()
+	assert_same_stream((Ssac + flushed[0], Esac + flushed[1]), x, y, time)
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_streaming_flush_and_reset():
+	x, y, time = (values.to_numpy() for values in random_trace(4))
+	detector = StreamingSaccadeDetector()
+
+	# flush returns the open saccade at the end of the data and resets the detector
+	assert_same_stream(stream_saccades(detector, x, y, time, [100]), x, y, time)
+	assert detector.flush() == ([], [])
+	assert_same_stream(stream_saccades(detector, x, y, time, [100]), x, y, time)
+
+	# reset forgets the samples of an interrupted stream
+	detector.push(x[:100], y[:100], time[:100])
+	detector.reset()
+	assert_same_stream(stream_saccades(detector, x, y, time, [100]), x, y, time)
+
+
+def test_streaming_saccade_at_end():
+	# the saccade does not end before the data, flush only returns its start
+	detector = StreamingSaccadeDetector()
+	Ssac, Esac = detector.push(np.array([100.0, 100, 100, 100, 300, 500, 700]), np.full(7, 100.0), np.arange(7) * 10.0)
+	assert Ssac == [] and Esac == []
+	assert detector.flush() == ([[30.0]], [])
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.token_metrics import token_fixations, token_fixation_lists, token_metrics
+
+
+def original_token_loop(df_token_fixation_per_participant, df_token_aois, participants):
+	# The loop of the RQ1 notebooks that token_fixations and token_fixation_lists replace, without the progress bar
+	df_token = df_token_aois.copy()
+	df_token = df_token.drop(["BoundingBox", "Token"], axis=1)
+	for participant in participants:
+		df_token.loc[:, f"TokenFixation_P{participant}"] = [[] for _ in range(len(df_token))]
+		df_token.loc[:, f"TokenReFixation_P{participant}"] = [[] for _ in range(len(df_token))]
+
+	prev_participant = df_token_fixation_per_participant["Participant"].iloc[0]
+	prev_token_idx = df_token_fixation_per_participant["TokenIdx"].iloc[0]
+	prev_algorithm = df_token_fixation_per_participant["Algorithm"].iloc[0]
+	fixations = []
+	re_fixation = False
+	for idx, row in df_token_fixation_per_participant.iterrows():
+		participant = row["Participant"]
+		token_idx = row["TokenIdx"]
+		algorithm = row["Algorithm"]
+		FixationDuration = row["FixationDuration"]
+
+		# fixation switches
+		if prev_participant != participant or prev_token_idx != token_idx:
+			index = df_token[(df_token["TokenIdx"] == prev_token_idx) & (df_token["Algorithm"] == prev_algorithm)].index[0]
+			if re_fixation:
+				re_fixations = df_token.loc[index, f"TokenReFixation_P{prev_participant}"]
+				re_fixations.extend(fixations.copy())
+				df_token.at[index, f"TokenReFixation_P{prev_participant}"] = re_fixations.copy()
+			else:
+				df_token.at[index, f"TokenFixation_P{prev_participant}"] = fixations.copy()
+			fixations = []
+			# possible new fixation
+			re_fixation = False
+
+		sub_frame = df_token[(df_token["TokenIdx"] == token_idx) & (df_token["Algorithm"] == algorithm)]
+		len_of_fixation = len(sub_frame[f"TokenFixation_P{participant}"].iloc[0])
+		if re_fixation == False and len_of_fixation > 0 and len(fixations) == 0:
+			re_fixation = True
+
+		fixations.append(FixationDuration)
+		prev_participant = participant
+		prev_token_idx = token_idx
+		prev_algorithm = algorithm
+	return df_token
+
+
+def token_table():
+	# Snippet A has the tokens 0 to 3, snippet B the tokens 0 to 2
+	return pd.DataFrame([(algorithm, "t", token, (0, 0, 0, 0)) for algorithm, count in [("A", 4), ("B", 3)] for token in range(count)],
+						columns=["Algorithm", "Token", "TokenIdx", "BoundingBox"])
+
+
+def fixation_table(fixations):
+	rows = [(algorithm, participant, number, duration, token) for number, (participant, algorithm, token, duration) in enumerate(fixations)]
+	return pd.DataFrame(rows, columns=["Algorithm", "Participant", "FixationNumber", "FixationDuration", "TokenIdx"])
+
+
+def hand_built_fixations():
+	"""
+	Participant 1 refixates token 0 of A and token 1 of B and skips token 3 of A and token 2 of B.
+	Participant 2 has no fixations on B, participant 3 none on A. The last run (participant 3 on token 0 of B) is
+	never stored by the loop.
+	"""
+	return fixation_table([
+		(1, "A", 0, 100.0), (1, "A", 0, 50.0), (1, "A", 1, 200.0), (1, "A", 0, 30.0), (1, "A", 2, 80.0), (1, "A", 2, 20.0),
+		(1, "B", 1, 60.0), (1, "B", 0, 40.0), (1, "B", 1, 70.0),
+		(2, "A", 3, 90.0), (2, "A", 1, 110.0), (2, "A", 3, 10.0),
+		(3, "B", 2, 150.0), (3, "B", 2, 25.0), (3, "B", 1, 35.0), (3, "B", 0, 5.0),
+	])
+
+
+def test_lists_equal_original_loop():
+	df_fixations = hand_built_fixations()
+	expected = original_token_loop(df_fixations, token_table(), [1, 2, 3])
+	df_token = token_fixation_lists(df_fixations, token_table(), [1, 2, 3], drop_last_run=True)
+	assert df_token.to_csv(sep=";", index=False) == expected.to_csv(sep=";", index=False)
+	assert df_token.loc[0, "TokenFixation_P1"] == [100.0, 50.0] and df_token.loc[0, "TokenReFixation_P1"] == [30.0]
+	assert df_token.loc[4, "TokenFixation_P3"] == []
+
+
+def test_token_fixations_equal_original_loop():
+	df_fixations = hand_built_fixations()
+	df_loop = original_token_loop(df_fixations, token_table(), [1, 2, 3])
+	expected = []
+	for participant in [1, 2, 3]:
+		for algorithm, token, first, refixations in zip(df_loop["Algorithm"], df_loop["TokenIdx"], df_loop[f"TokenFixation_P{participant}"], df_loop[f"TokenReFixation_P{participant}"]):
+			if len(first) > 0:
+				expected.append((participant, algorithm, token, len(first), first[0], sum(first), len(refixations), sum(first) + sum(refixations)))
+
+	df_tokens = token_fixations(df_fixations, drop_last_run=True)
+	columns = ["Participant", "Algorithm", "TokenIdx", "FirstPassFixations", "FirstFixationDuration", "GazeDuration", "ReFixations", "TotalTime"]
+	assert sorted(df_tokens[columns].itertuples(index=False, name=None)) == sorted(expected)
+
+
+def test_snippet_boundary_splits_runs():
+	# Participant 1 looks at token 2 at the end of A and at the start of B. The loop only split runs on a participant
+	# or token change and stored both fixations as first pass of token 2 of B, the runs are split at the snippet
+	df_fixations = fixation_table([(1, "A", 0, 100.0), (1, "A", 2, 50.0), (1, "B", 2, 70.0), (1, "B", 0, 10.0)])
+	df_loop = original_token_loop(df_fixations, token_table(), [1])
+	assert df_loop.loc[2, "TokenFixation_P1"] == [] and df_loop.loc[6, "TokenFixation_P1"] == [50.0, 70.0]
+
+	df_token = token_fixation_lists(df_fixations, token_table(), [1], drop_last_run=True)
+	assert df_token.loc[2, "TokenFixation_P1"] == [50.0] and df_token.loc[6, "TokenFixation_P1"] == [70.0]
+
+
+def test_token_metrics():
+	df_skill = pd.DataFrame({"Participant": [1, 2, 3, 3], "SkillScore": [0.5, 1.5, 2.0, 2.0]})
+	metrics = token_metrics(hand_built_fixations(), token_table(), [3, 1, 2], df_skill, drop_last_run=True)
+
+	# The durations are averaged over the fixated tokens, the probabilities over the snippets where they are not 0
+	expected = pd.DataFrame({
+		"FirstFixationDuration": [96.0, 100.0, 92.5],
+		"SingleFixationDuration": [100.0, 100.0, 35.0],
+		"GazeDuration": [110.0, 100.0, 105.0],
+		"TotalTime": [130.0, 105.0, 105.0],
+		"TokenNoFixationProbability": [(1 / 4 + 1 / 3) / 2, (2 / 4 + 3 / 3) / 2, (4 / 4 + 1 / 3) / 2],
+		"TokenSingleFixationProbability": [(1 / 4 + 1 / 3) / 2, 1 / 4, 1 / 3],
+		# participant 3 has no refixation on any snippet, like participant 41 in the study
+		"TokenMultipleFixationProbability": [(1 / 4 + 1 / 3) / 2, 1 / 4, 0.0],
+		"TokenFixationProbability": [(3 / 4 + 2 / 3) / 2, 2 / 4, 2 / 3],
+		"Skill": [0.5, 1.5, 2.0],
+	})
+	pd.testing.assert_frame_equal(metrics, expected, check_exact=False, rtol=1e-12)
+
+
+def test_token_metrics_keep_last_run():
+	# Without drop_last_run the last run of participant 3 counts as well
+	metrics = token_metrics(hand_built_fixations(), token_table(), [1, 2, 3], drop_last_run=False)
+	assert metrics["FirstFixationDuration"].iloc[2] == pytest.approx((150.0 + 35.0 + 5.0) / 3)
+	assert metrics["TokenNoFixationProbability"].iloc[2] == pytest.approx(4 / 4)
+	assert "Skill" not in metrics.columns
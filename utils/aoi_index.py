@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+def fixation_rectangles(x, y, x_range, y_range):
+	"""
+	Returns the pixel rectangle that is tested for each fixation, like in the RQ1 notebooks:
+	int(x - ceil(x_range)) to int(x + ceil(x_range)) and the same for y, both ends included.
+	"""
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	x_range = np.ceil(np.asarray(x_range, dtype=np.float64))
+	y_range = np.ceil(np.asarray(y_range, dtype=np.float64))
+	return np.trunc(x - x_range), np.trunc(y - y_range), np.trunc(x + x_range), np.trunc(y + y_range)
+
+
+class BoxIndex:
+
+	"""
+	Index over the bounding boxes (left, top, right, bottom) of the tokens, AOIs or lines of a snippet.
+
+	The boxes are sorted into horizontal bands of the screen, like the lines of the code, so a fixation is only
+	compared with the boxes of the bands it covers. A box is hit by a pixel rectangle if a pixel of the rectangle
+	lies in the box, borders included.
+	"""
+
+	def __init__(self, boxes, band_height=None):
+		self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+		if len(self.boxes) == 0:
+			self.band_height = 1.0
+			self.top = 0.0
+			self.band_starts = np.zeros(1, dtype=np.int64)
+			self.band_boxes = np.zeros(0, dtype=np.int64)
+			return
+
+		# Bands as high as a typical box, so most boxes lie in one or two bands
+		if band_height is None:
+			band_height = np.median(self.boxes[:, 3] - self.boxes[:, 1])
+		self.band_height = max(float(band_height), 1.0)
+		self.top = self.boxes[:, 1].min()
+
+		# The boxes of each band, sorted by band and then by box, stored as one array with the start of each band
+		first_band = self.band(self.boxes[:, 1])
+		last_band = self.band(self.boxes[:, 3])
+		counts = last_band - first_band + 1
+		boxes = np.repeat(np.arange(len(self.boxes)), counts)
+		bands = np.repeat(first_band, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		order = np.lexsort((boxes, bands))
+		self.band_boxes = boxes[order]
+		self.band_starts = np.concatenate([[0], np.cumsum(np.bincount(bands, minlength=last_band.max() + 1))])
+
+	def band(self, y):
+		return np.floor((np.asarray(y, dtype=np.float64) - self.top) / self.band_height).astype(np.int64)
+
+	def query(self, low_x, low_y, high_x, high_y):
+		"""
+		Finds the boxes hit by each rectangle.
+
+		Returns:
+			np.ndarray: The rectangle of each hit.
+			np.ndarray: The box of each hit, the hits are sorted by rectangle and then by box.
+		"""
+		low_x, low_y, high_x, high_y = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in [low_x, low_y, high_x, high_y]])
+		number_of_bands = len(self.band_starts) - 1
+
+		# The bands covered by each rectangle, empty rectangles (or ones with NaN) cover none
+		with np.errstate(invalid='ignore'):
+			valid = (low_y <= high_y) & (low_x <= high_x)
+		first_band = np.maximum(self.band(np.where(valid, low_y, self.top)), 0)
+		last_band = np.minimum(self.band(np.where(valid, high_y, self.top)), number_of_bands - 1)
+		band_counts = np.where(valid, np.maximum(last_band - first_band + 1, 0), 0)
+
+		# One candidate for each rectangle and box of its bands
+		rectangles = np.repeat(np.arange(len(low_x)), band_counts)
+		bands = np.repeat(first_band, band_counts) + np.arange(band_counts.sum()) - np.repeat(np.cumsum(band_counts) - band_counts, band_counts)
+		box_counts = self.band_starts[bands + 1] - self.band_starts[bands]
+		candidates = np.repeat(rectangles, box_counts)
+		positions = np.repeat(self.band_starts[bands], box_counts) + np.arange(box_counts.sum()) - np.repeat(np.cumsum(box_counts) - box_counts, box_counts)
+		boxes = self.band_boxes[positions]
+
+		# A pixel of the rectangle lies in the box if the overlap of both contains a whole pixel coordinate
+		box = self.boxes[boxes]
+		hit = (np.ceil(np.maximum(low_x[candidates], box[:, 0])) <= np.floor(np.minimum(high_x[candidates], box[:, 2]))) & \
+			(np.ceil(np.maximum(low_y[candidates], box[:, 1])) <= np.floor(np.minimum(high_y[candidates], box[:, 3])))
+
+		# A box spanning several bands may be found more than once
+		keys = np.unique(candidates[hit] * len(self.boxes) + boxes[hit])
+		return keys // max(len(self.boxes), 1), keys % max(len(self.boxes), 1)
+
+	def first_hit(self, low_x, low_y, high_x, high_y):
+		"""Returns for each rectangle the first box it hits, -1 if it hits none"""
+		rectangles, boxes = self.query(low_x, low_y, high_x, high_y)
+		first = np.full(np.broadcast(np.asarray(low_x), np.asarray(low_y)).size, -1, dtype=np.int64)
+		# The hits are sorted by rectangle and box, so the first hit of a rectangle is its first box
+		unique_rectangles, first_positions = np.unique(rectangles, return_index=True)
+		first[unique_rectangles] = boxes[first_positions]
+		return first
+
+
+def fixation_hits(df_trials, trial_fixations, df_boxes, first_only=True, vertical_only=False):
+	"""
+	Maps the fixations of each trial to the boxes of its snippet, e.g. the tokens, AOIs or lines of the RQ1 notebooks.
+	The hits are ordered like the loops of the notebooks: by snippet and participant in the order they first appear
+	in df_trials, then by fixation and then by box. Only the first trial of each snippet and participant is used.
+
+	Parameters:
+		df_trials (pd.DataFrame): One row per trial with the columns Algorithm and Participant.
+		trial_fixations (list or dict): For each index label of df_trials a dict with the arrays StartT, EndT, X, Y, XRange and YRange.
+		df_boxes (pd.DataFrame): One row per box with the columns Algorithm and BoundingBox (left, top, right, bottom).
+		first_only (bool): Only keep the first box a fixation hits (tokens and lines), otherwise keep all (AOIs).
+		vertical_only (bool): Only test the vertical position (lines).
+
+	Returns:
+		pd.DataFrame: One row per hit with Algorithm, Participant, FixationNumber, StartT, EndT and Box,
+		the position of the hit box in df_boxes.
+	"""
+	participants = df_trials["Participant"].unique()
+	box_algorithms = df_boxes["Algorithm"].to_numpy()
+	bounding_boxes = df_boxes["BoundingBox"].tolist()
+
+	hits = []
+	for snippet in df_trials["Algorithm"].unique():
+		# Index over the boxes of the snippet
+		box_rows = np.flatnonzero(box_algorithms == snippet)
+		index = BoxIndex([bounding_boxes[row] for row in box_rows])
+
+		# The fixations of all participants of the snippet are tested in one call
+		df_snippet = df_trials[df_trials["Algorithm"] == snippet]
+		first_trials = df_snippet.index.to_series().groupby(df_snippet["Participant"].to_numpy()).first()
+		trials = [(participant, trial_fixations[first_trials[participant]]) for participant in participants if participant in first_trials.index]
+		if len(trials) == 0:
+			continue
+		# The times keep their type, e.g. whole milliseconds of Ogama, the positions are tested as floats
+		fixations = {name: np.concatenate([np.asarray(fixation[name]) for _, fixation in trials]) for name in ["StartT", "EndT"]}
+		fixations.update({name: np.concatenate([np.asarray(fixation[name], dtype=np.float64) for _, fixation in trials]) for name in ["X", "Y", "XRange", "YRange"]})
+		counts = [len(fixation["StartT"]) for _, fixation in trials]
+
+		low_x, low_y, high_x, high_y = fixation_rectangles(fixations["X"], fixations["Y"], fixations["XRange"], fixations["YRange"])
+		if vertical_only:
+			low_x = np.full(len(low_x), -np.inf)
+			high_x = np.full(len(high_x), np.inf)
+		if first_only:
+			boxes = index.first_hit(low_x, low_y, high_x, high_y)
+			hit_fixations = np.flatnonzero(boxes >= 0)
+			boxes = boxes[hit_fixations]
+		else:
+			hit_fixations, boxes = index.query(low_x, low_y, high_x, high_y)
+
+		hits.append(pd.DataFrame({
+			"Algorithm": snippet,
+			"Participant": np.repeat([participant for participant, _ in trials], counts)[hit_fixations],
+			"FixationNumber": (np.arange(len(low_x)) - np.repeat(np.cumsum(counts) - counts, counts))[hit_fixations],
+			"StartT": fixations["StartT"][hit_fixations],
+			"EndT": fixations["EndT"][hit_fixations],
+			"Box": box_rows[boxes],
+		}))
+
+	if len(hits) == 0:
+		return pd.DataFrame(columns=["Algorithm", "Participant", "FixationNumber", "StartT", "EndT", "Box"])
+	return pd.concat(hits, ignore_index=True)
@@ -0,0 +1,63 @@
+import os
+import hashlib
+import numpy as np
+
+# Directory for the cached recordings, None stores them in a .cache folder next to the raw files
+cache_directory = None
+# Set to False to always parse the raw files
+use_cache = True
+# Identify a file by a hash of its content instead of its path, size and modification time
+hash_content = False
+
+# Increase when the layout of the cached arrays changes, so old cache files are not used anymore
+cache_version = 2
+
+
+def file_fingerprint(path, content=False):
+	"""Returns a hex digest identifying the file: its path, size and modification time, or its content"""
+	digest = hashlib.sha1()
+	if content:
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b''):
+				digest.update(block)
+	else:
+		stat = os.stat(path)
+		digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+	return digest.hexdigest()
+
+
+def cache_file_path(path, kind):
+	directory = cache_directory
+	if directory is None:
+		directory = os.path.join(os.path.dirname(os.path.abspath(path)), '.cache')
+	key = file_fingerprint(path, hash_content)
+	return os.path.join(directory, f"{kind}_v{cache_version}_{key}.npz")
+
+
+def cached_arrays(path, kind, loader):
+	"""
+	Returns loader(path), a dict of numpy arrays, and stores it as npz file after the first call.
+
+	Parameters:
+		path (str): The raw file the arrays are parsed from.
+		kind (str): Name of the loader, part of the cache key.
+		loader (function): Parses the raw file into a dict of numpy arrays (no object arrays).
+	"""
+	if not use_cache:
+		return loader(path)
+
+	cache_file = cache_file_path(path, kind)
+	if os.path.exists(cache_file):
+		with np.load(cache_file, allow_pickle=False) as data:
+			return {name: data[name] for name in data.files}
+
+	arrays = loader(path)
+
+	# Write to a temporary file first, so that parallel runs never read a partly written cache file
+	os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+	temporary_file = f"{cache_file}.{os.getpid()}.tmp"
+	with open(temporary_file, 'wb') as f:
+		np.savez(f, **arrays)
+	os.replace(temporary_file, cache_file)
+
+	return arrays
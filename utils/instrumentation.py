@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+# Set to True (or call enable) to record the wall time, samples and memory of the stages of the pipelines
+enabled = False
+# Append each finished stage as one JSON line to this file, so stages of worker processes are kept as well.
+# None keeps the stages only in records of the current process
+log_path = None
+# Record the peak memory allocated by Python and numpy during each stage, tracemalloc slows the stages down
+trace_memory = False
+# Profile the stages of the file with this name (or path) with cProfile and tracemalloc, None profiles nothing
+profile_file = None
+# Directory for the profiles, None stores them in the working directory
+profile_directory = None
+
+# Stages finished in this process
+records = []
+# Stages that are running, the innermost one last
+open_stages = []
+
+
+def enable(log=None, memory=True, profile=None, directory=None):
+	"""
+	Turns on the instrumentation of this process, worker processes only inherit it where they are forked.
+
+	Parameters:
+		log (str): JSON lines file each finished stage is appended to, None keeps the stages only in records.
+		memory (bool): Record the peak memory of each stage with tracemalloc.
+		profile (str): Name or path of the file whose stages are profiled with cProfile and tracemalloc.
+		directory (str): Directory for the profiles.
+	"""
+	global enabled, log_path, trace_memory, profile_file, profile_directory
+	enabled = True
+	log_path = log
+	trace_memory = memory
+	profile_file = profile
+	profile_directory = directory
+	if trace_memory and not tracemalloc.is_tracing():
+		tracemalloc.start()
+
+
+def disable():
+	global enabled
+	enabled = False
+	if tracemalloc.is_tracing():
+		tracemalloc.stop()
+
+
+def reset():
+	# Forget the stages recorded so far
+	del records[:]
+
+
+def is_profiled(path):
+	if profile_file is None or path is None:
+		return False
+	return os.path.basename(path) == profile_file or os.path.abspath(path) == os.path.abspath(profile_file)
+
+
+@contextmanager
+def stage(name, path=None, samples=None, **fields):
+	"""
+	Records a stage of a pipeline, e.g. parsing a file or detecting the fixations of a task.
+	Yields the record of the stage, the caller can set the number of samples in it once they are known.
+	Nested stages without a path belong to the file of the enclosing stage.
+
+	Parameters:
+		name (str): Name of the stage, stages with the same name are summed up in the summary.
+		path (str): The file the stage processes.
+		samples (int): Number of samples the stage processes.
+		fields: Further values stored in the record, e.g. the task or subject.
+	"""
+	if not enabled:
+		yield {}
+		return
+
+	if path is None and len(open_stages) > 0:
+		path = open_stages[-1]['file']
+	record = dict(fields, stage=name, file=path, samples=samples, pid=os.getpid())
+
+	# Only the outermost stage of the selected file is profiled
+	profile = None
+	stop_tracing = False
+	if is_profiled(path) and not any(is_profiled(parent['file']) for parent in open_stages):
+		profile = cProfile.Profile()
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+			stop_tracing = True
+
+	# The peak of tracemalloc is reset for each stage, the enclosing stage keeps the peak it had so far
+	# (Python 3.8 can not reset the peak, there a stage reports the peak since tracing started)
+	memory = trace_memory and tracemalloc.is_tracing()
+	current_memory = 0
+	if memory:
+		current_memory, peak = tracemalloc.get_traced_memory()
+		if len(open_stages) > 0:
+			open_stages[-1]['peak'] = max(open_stages[-1]['peak'], peak)
+		if hasattr(tracemalloc, 'reset_peak'):
+			tracemalloc.reset_peak()
+	open_stages.append({'file': path, 'peak': 0, 'memory': current_memory})
+
+	if profile is not None:
+		profile.enable()
+	start = time.perf_counter()
+	try:
+		yield record
+	finally:
+		record['seconds'] = time.perf_counter() - start
+		if profile is not None:
+			profile.disable()
+
+		current = open_stages.pop()
+		if memory:
+			peak = max(current['peak'], tracemalloc.get_traced_memory()[1])
+			# Memory allocated on top of the memory in use when the stage started
+			record['peak_memory_mb'] = (peak - current['memory']) / 2**20
+			if len(open_stages) > 0:
+				open_stages[-1]['peak'] = max(open_stages[-1]['peak'], peak)
+
+		if profile is not None:
+			write_profile(profile, record)
+			if stop_tracing:
+				tracemalloc.stop()
+		store(record)
+
+
+def write_profile(profile, record):
+	# Save the cProfile statistics and the lines that allocated the most memory
+	directory = profile_directory if profile_directory is not None else os.getcwd()
+	os.makedirs(directory, exist_ok=True)
+	prefix = os.path.join(directory, f"{os.path.basename(record['file'])}.{record['stage']}")
+	profile.dump_stats(prefix + '.prof')
+	with open(prefix + '.txt', 'w') as f:
+		pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(40)
+		f.write('Top memory allocations:\n')
+		for statistic in tracemalloc.take_snapshot().statistics('lineno')[:25]:
+			f.write(f"{statistic}\n")
+
+
+def store(record):
+	records.append(record)
+	if log_path is not None:
+		# One line per write, so the lines of processes writing at the same time do not mix
+		with open(log_path, 'a') as f:
+			f.write(json.dumps(record, default=str) + '\n')
+
+
+def load_log(path):
+	"""Returns the records of a JSON lines file written by the stages"""
+	with open(path) as f:
+		return [json.loads(line) for line in f if line.strip() != '']
+
+
+def summary(stage_records=None):
+	"""
+	Sums up the records (by default the ones of this process) per stage.
+
+	Returns:
+		dict: For each stage the number of calls and files, the samples, the seconds, the samples per second
+		and the largest peak memory of a call in MB (None if memory was not traced).
+	"""
+	if stage_records is None:
+		stage_records = records
+
+	stages = {}
+	for record in stage_records:
+		entry = stages.setdefault(record['stage'], {'calls': 0, 'files': set(), 'samples': 0, 'seconds': 0.0, 'peak_memory_mb': None})
+		entry['calls'] += 1
+		entry['files'].add(record['file'])
+		entry['samples'] += record['samples'] or 0
+		entry['seconds'] += record['seconds']
+		if record.get('peak_memory_mb') is not None:
+			entry['peak_memory_mb'] = max(entry['peak_memory_mb'] or 0.0, record['peak_memory_mb'])
+
+	for entry in stages.values():
+		entry['files'] = len(entry['files'])
+		entry['samples_per_second'] = entry['samples'] / entry['seconds'] if entry['seconds'] > 0 else None
+	return stages
+
+
+def write_summary(path, stage_records=None):
+	"""Writes the summary and the single records as JSON file"""
+	if stage_records is None:
+		stage_records = records
+	with open(path, 'w') as f:
+		json.dump({'summary': summary(stage_records), 'records': stage_records}, f, indent=2, default=str)
+
+
+def print_summary(stage_records=None):
+	for name, entry in summary(stage_records).items():
+		memory = f"{entry['peak_memory_mb']:>10.1f} MB" if entry['peak_memory_mb'] is not None else ''
+		print(f"{name:<34}{entry['calls']:>6} calls{entry['seconds']:>12.3f} s{entry['samples']:>14,} samples{memory}")
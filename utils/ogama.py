@@ -1,8 +1,14 @@
 import os
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import sqlite3
 import numpy as np
+from utils import instrumentation
 from utils.peitek_opt import opt
+from utils.peitek import to_display_coordinates
+from utils.recordings import load_tobii_recording, tobii_tasks, load_sharafi_recording, removed_task_names
 
 # Need to register numpy types to be able to save them in the database, as SQL only supports int8
 sqlite3.register_adapter(np.int64, lambda val: int(val))
@@ -11,19 +17,231 @@ sqlite3.register_adapter(np.int32, lambda val: int(val))
 # Path to database (Change this to your database path of the Ogama experiment)
 base_database_path = 'G:\\Dokumente\\OgamaExperiments\\Experiment4_1\\Database\\Experiment4_1.db'
 
+# Number of raw data rows that are inserted with one executemany call
+insert_chunk_size = 50000
+
+# Store the samples of all subjects in one table instead of one [S<n>Rawdata] table per subject. Ogama only reads
+# the tables of the subjects, they are created as views on the single table
+single_rawdata_table = False
+# Name of the single table
+rawdata_table = 'AllRawdata'
+
+# Columns of the raw data tables of Ogama
+rawdata_columns = "[ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL,[SubjectName] varchar(50) NOT NULL COLLATE NOCASE, [TrialSequence] integer NOT NULL, [Time] integer NOT NULL, [PupilDiaX] float, [PupilDiaY] float, [GazePosX] float, [GazePosY] float, [MousePosX] float, [MousePosY] float, [EventID] integer"
+
+
+def connect_for_import(database_path):
+	conn = sqlite3.connect(database_path)
+	# Settings for bulk imports: keep the rollback journal in memory, do not wait for the disk after each transaction
+	# and use a 64 MB page cache. Without a journal on disk a crash or power loss during the import can corrupt the
+	# whole database, not only lose the current subject, so an interrupted import may require restoring the database
+	# from a backup. The rollback journal modes only hold for this connection, but setting the journal mode of a WAL
+	# database would switch the file out of WAL for good, so WAL databases keep their journal and only skip some syncs
+	journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+	if journal_mode.lower() == "wal":
+		conn.execute("PRAGMA synchronous = NORMAL")
+	else:
+		conn.execute("PRAGMA journal_mode = MEMORY")
+		conn.execute("PRAGMA synchronous = OFF")
+	conn.execute("PRAGMA cache_size = -65536")
+	return conn
+
+
+def create_rawdata_table(c, subject):
+	if not single_rawdata_table:
+		# Add a table for the subject called Subject + 'RawData'
+		c.execute("CREATE TABLE IF NOT EXISTS ["+ subject +"Rawdata] (" + rawdata_columns + ")")
+		return
+
+	# One table for all subjects with an index covering the lookups of the samples of a trial in their order
+	c.execute("CREATE TABLE IF NOT EXISTS [" + rawdata_table + "] (" + rawdata_columns + ")")
+	c.execute("CREATE INDEX IF NOT EXISTS [" + rawdata_table + "SubjectTrialTime] ON [" + rawdata_table + "] (SubjectName, TrialSequence, Time, GazePosX, GazePosY)")
+	# The table Ogama expects for the subject shows its samples of the single table
+	c.execute("CREATE VIEW IF NOT EXISTS ["+ subject +"Rawdata] AS SELECT * FROM [" + rawdata_table + "] WHERE SubjectName = '" + subject.replace("'", "''") + "'")
+
+
+def drop_all_rawdata(c, subjects):
+	"""
+	Drops the raw data tables (or views) of the subjects and deletes all samples of the single table.
+
+	Parameters:
+		c (sqlite3.Cursor): Cursor of the database connection.
+		subjects (list): The names of the subjects, e.g. 'S1'.
+	"""
+	names = {(subject + 'Rawdata').lower() for subject in subjects}
+	for name, kind in c.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')").fetchall():
+		if name.lower() in names:
+			c.execute("DROP " + kind.upper() + " [" + name + "]")
+		elif name.lower() == rawdata_table.lower():
+			c.execute("DELETE FROM [" + rawdata_table + "]")
+
+
+def insert_raw_data(c, subject, trial_sequence, time, x, y):
+	# Insert the samples into the raw data table of the subject in chunks
+	# trial_sequence is either one value for all samples or one value per sample
+	time = np.asarray(time).tolist()
+	if np.ndim(trial_sequence) == 0:
+		trial_sequence = itertools.repeat(trial_sequence)
+	else:
+		trial_sequence = np.asarray(trial_sequence).tolist()
+	rows = zip(itertools.repeat(subject), trial_sequence, time, np.asarray(x).tolist(), np.asarray(y).tolist())
+
+	table = rawdata_table if single_rawdata_table else subject + "Rawdata"
+	query = "INSERT INTO ["+ table +"] (SubjectName, TrialSequence, Time, GazePosX, GazePosY) VALUES (?, ?, ?, ?, ?)"
+	chunk = list(itertools.islice(rows, insert_chunk_size))
+	while len(chunk) > 0:
+		c.executemany(query, chunk)
+		chunk = list(itertools.islice(rows, insert_chunk_size))
+
+
+def write_prepared_subject(c, prepared):
+	"""
+	Writes a subject prepared by prepare_subject_sharafi or prepare_subject_emip to the database.
+
+	Parameters:
+		c (sqlite3.Cursor): Cursor of the database connection.
+		prepared (dict): Subject (name), Rawdata (list of (trial sequence, time, x, y)) and Trials (rows of the Trials table).
+	"""
+	subject = prepared['Subject']
+	samples = sum(len(time) for _, time, _, _ in prepared['Rawdata'])
+
+	with instrumentation.stage('write_subject', samples=samples, subject=subject):
+		# Add a table for the subject called Subject + 'RawData'
+		if len(prepared['Rawdata']) > 0:
+			create_rawdata_table(c, subject)
+
+		for trial_sequence, time, x, y in prepared['Rawdata']:
+			insert_raw_data(c, subject, trial_sequence, time, x, y)
+
+		c.executemany("INSERT INTO Trials (SubjectName, TrialID, TrialName, TrialSequence, Category,  TrialStartTime, Duration) VALUES (?, ?, ?, ?, ?, ?, ?)", prepared['Trials'])
+
+		# Add subject to the Subjects table
+		c.execute("INSERT INTO Subjects (SubjectName) VALUES (?)", (subject,))
+
+
+def prepare_subject(prepare, path, subject):
+	# Parse and prepare a subject, timed as one stage of its file when the instrumentation is enabled
+	with instrumentation.stage(prepare.__name__, path, subject=subject) as record:
+		prepared = prepare(path, subject)
+		record['samples'] = sum(len(time) for _, time, _, _ in prepared['Rawdata'])
+	return prepared
+
+
+def prepared_subjects(prepare, paths, subjects, workers=None):
+	# Yields prepare(path, subject) in the order of the subjects
+	if workers is None or workers <= 1:
+		yield from map(prepare_subject, itertools.repeat(prepare), paths, subjects)
+		return
+
+	# Only a few subjects are prepared ahead, so the prepared rows do not pile up while the writer is busy
+	jobs = zip(paths, subjects)
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		pending = deque(executor.submit(prepare_subject, prepare, path, subject) for path, subject in itertools.islice(jobs, 2 * workers))
+		while len(pending) > 0:
+			prepared = pending.popleft().result()
+			for path, subject in itertools.islice(jobs, 1):
+				pending.append(executor.submit(prepare_subject, prepare, path, subject))
+			yield prepared
+
+
+def import_subjects_into_ogama(prepare, paths, subjects, database_path=base_database_path, workers=None):
+	"""
+	Imports several subjects: they are parsed and prepared in a process pool and written by this process,
+	which owns the only connection to the database. Each subject is committed on its own.
+
+	Parameters:
+		prepare (function): prepare_subject_sharafi or prepare_subject_emip.
+		paths (list): The data file of each subject.
+		subjects (list): The name of each subject, e.g. 'S1'.
+		workers (int): Number of processes preparing the subjects, None prepares them one after another.
+	"""
+	# Check if database exists
+	if not os.path.exists(database_path):
+		raise Exception("Database does not exist")
+
+	# Connect to database
+	conn = connect_for_import(database_path)
+	c = conn.cursor()
+
+	for prepared in prepared_subjects(prepare, paths, subjects, workers):
+		write_prepared_subject(c, prepared)
+		# Save the database
+		with instrumentation.stage('commit', subject=prepared['Subject']):
+			conn.commit()
+		print('Imported data for subject ' + prepared['Subject'])
+
+
+def create_gaze_fixations_index(c):
+	# Index on the subject and trial that also holds the length, so the results are read from the index alone
+	c.execute("CREATE INDEX IF NOT EXISTS GazeFixationsSubjectTrial ON GazeFixations (SubjectName, TrialID, Length)")
+
+
+def calculate_results_for_subjects(subjects=None, database_path=base_database_path):
+	"""
+	Calculates the results of calculate_results_for_subject_sharafi and calculate_results_for_subject_emip for
+	several subjects with one query, like concatenating the results of the subjects one after another.
+
+	Parameters:
+		subjects (list): The subjects, e.g. ['S1', 'S2'], None calculates the results of all subjects with fixations.
+		database_path (str): The Ogama database with the GazeFixations table.
+
+	Returns:
+		pd.DataFrame: The Total Fixation Count, Total Fixation Duration, Average Fixation Duration and Subject of each
+		subject and TrialID, indexed by the TrialID. The subjects are in the given order (else sorted by name) and
+		their trials are sorted.
+	"""
+	# Check if database exists
+	if not os.path.exists(database_path):
+		raise Exception("Database does not exist")
+
+	# Connect to database
+	conn = sqlite3.connect(database_path)
+	c = conn.cursor()
+	create_gaze_fixations_index(c)
+	conn.commit()
+
+	# Fixation count, duration and average duration of each subject and trial
+	aggregates = "TrialID, COUNT(ID), COALESCE(SUM(Length), 0), AVG(Length)"
+	if subjects is None:
+		query = "SELECT SubjectName, " + aggregates + " FROM GazeFixations GROUP BY SubjectName, TrialID ORDER BY SubjectName, TrialID"
+	else:
+		# The subjects are joined as table, so their number is not limited by the number of query parameters
+		c.execute("CREATE TEMP TABLE ResultSubjects (Position integer, SubjectName varchar(50))")
+		c.executemany("INSERT INTO ResultSubjects VALUES (?, ?)", enumerate(subjects))
+		query = "SELECT ResultSubjects.SubjectName, " + aggregates + " FROM ResultSubjects JOIN GazeFixations ON GazeFixations.SubjectName = ResultSubjects.SubjectName GROUP BY ResultSubjects.Position, TrialID ORDER BY ResultSubjects.Position, TrialID"
+	rows = c.execute(query).fetchall()
+	conn.close()
+
+	results = pd.DataFrame(rows, columns=['Subject', 'TrialID', 'Total Fixation Count', 'Total Fixation Duration', 'Average Fixation Duration'])
+	results = results.astype({'Total Fixation Count': np.int64, 'Average Fixation Duration': np.float64})
+	if len(rows) == 0:
+		results = results.astype({'TrialID': np.int64, 'Total Fixation Duration': np.int64})
+	results = results.set_index('TrialID')
+	return results[['Total Fixation Count', 'Total Fixation Duration', 'Average Fixation Duration', 'Subject']]
+
 ######################################Sharafi Ogama########################################
 
-def import_data_into_ogama_sharafi(path, subject, database_path=base_database_path):
+def prepare_subject_sharafi(path, subject):
 
 	# We load the original data from the file data/4/formatted-raw-data/151/ogama.txt
-	data = pd.read_csv(path, sep=',', skiprows=0, encoding='utf-16')
+	recording = load_sharafi_recording(path)
+
+	# We remove all rows where Included? is "N"
+	included = recording['Included']
+	data = pd.DataFrame({
+		' ImageName': recording['ImageName'][included],
+		' X': recording['X'][included],
+		' Y': recording['Y'][included],
+		' StartTime': recording['StartTime'][included],
+		' Duration': recording['Duration'][included],
+	})
+
+	# Samples without image name keep NaN, so they belong to no trial
+	data[' ImageName'] = data[' ImageName'].where(recording['HasImage'][included])
 
 	# Change the values of the ImageName column to remove the last 4 characters (".PNG")
 	data[' ImageName'] = data[' ImageName'].str[:-4]
 
-	# We remove all rows where Included? is "N"
-	data = data[data[' Included?'] == "Y"]
-
 	# Normalize time
 	data[' StartTime'] = data[' StartTime'] - data[' StartTime'].min()
 	# Time as integer
@@ -33,42 +251,41 @@ def import_data_into_ogama_sharafi(path, subject, database_path=base_database_pa
 	data[' X'] = data[' X'] * 1920 / 1024
 	data[' Y'] = data[' Y'] * 1080 / 768
 
-	# Check if database exists
-	if not os.path.exists(database_path):
-		raise Exception("Database does not exist")
-	# Connect to database
-	conn = sqlite3.connect(database_path)
-	c = conn.cursor()
-
-	# Add a table for the subject called Subject + 'RawData'
-	c.execute("CREATE TABLE IF NOT EXISTS ["+ subject +"Rawdata] ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL,[SubjectName] varchar(50) NOT NULL COLLATE NOCASE, [TrialSequence] integer NOT NULL, [Time] integer NOT NULL, [PupilDiaX] float, [PupilDiaY] float, [GazePosX] float, [GazePosY] float, [MousePosX] float, [MousePosY] float, [EventID] integer)")
-
 	# Add data in the following scheme:
 		# SubjectName = subject
 		# TrialSequence = ' ImageName'
 		# Time = ' StartTime'
 		# GazePosX = ' X'
 		# GazePosY = ' Y'
-	
-	# For each row in the dataframe
-	for index, row in data.iterrows():
-		# Insert the data into the table
-		c.execute("INSERT INTO ["+ subject +"Rawdata] (SubjectName, TrialSequence, Time, GazePosX, GazePosY) VALUES (?, ?, ?, ?, ?)", (subject, row[' ImageName'], row[' StartTime'], row[' X'], row[' Y']))
-
-	# Add subject to the Subjects table
-	c.execute("INSERT INTO Subjects (SubjectName) VALUES (?)", (subject,))
+	rawdata = [(data[' ImageName'].to_numpy(), data[' StartTime'].to_numpy(), data[' X'].to_numpy(), data[' Y'].to_numpy())]
 
 	# Add each grouped trial to the Trials table
+	trials = []
 	for trial in data.groupby(' ImageName'):
 		trialstarttime = trial[1][' StartTime'].min()
 		# Max Starttime + last duration
 		trialduration = trial[1][' StartTime'].max() - trial[1][' StartTime'].min() + trial[1][' Duration'].iloc[-1]
 		trialduration = int(trialduration)
-		c.execute("INSERT INTO Trials (SubjectName, TrialID, TrialName, TrialSequence, Category,  TrialStartTime, Duration) VALUES (?, ?, ?, ?, ?, ?, ?)", (subject, trial[0], trial[0], trial[0], "",trialstarttime, trialduration))
+		trials.append((subject, trial[0], trial[0], trial[0], "",trialstarttime, trialduration))
+
+	return {'Subject': subject, 'Rawdata': rawdata, 'Trials': trials}
+
+def import_data_into_ogama_sharafi(path, subject, database_path=base_database_path):
+	prepared = prepare_subject(prepare_subject_sharafi, path, subject)
+
+	# Check if database exists
+	if not os.path.exists(database_path):
+		raise Exception("Database does not exist")
+	# Connect to database
+	conn = connect_for_import(database_path)
+	write_prepared_subject(conn.cursor(), prepared)
 
 	# Save the database
 	conn.commit()
 
+def import_data_into_ogama_sharafi_batch(paths, subjects, database_path=base_database_path, workers=None):
+	import_subjects_into_ogama(prepare_subject_sharafi, paths, subjects, database_path, workers)
+
 def drop_all_subject_tables_sharafi(database_path=base_database_path):
 	# Check if database exists
 	if not os.path.exists(database_path):
@@ -77,9 +294,8 @@ def drop_all_subject_tables_sharafi(database_path=base_database_path):
 	conn = sqlite3.connect(database_path)
 	c = conn.cursor()
 
-	for i in range(151, 205):
-		# Drop the table named S + str(i) + "RawData"
-		c.execute("DROP TABLE IF EXISTS S" + str(i) + "Rawdata")
+	# Drop the tables named S + str(i) + "RawData"
+	drop_all_rawdata(c, ["S" + str(i) for i in range(151, 205)])
 
 	# Delete entries from Trials
 	c.execute("DELETE FROM Trials")
@@ -134,7 +350,7 @@ trial_to_num_emip = {
 		'vehicle_scala.jpg': '10',
 	}
 
-def add_to_sql_emip(c, df_msg, subject, last_task_name):
+def add_to_prepared_emip(prepared, df_msg, last_task_name):
 
 	df_msg = df_msg[(df_msg['R Validity'] == 1)].copy()
 
@@ -148,10 +364,7 @@ def add_to_sql_emip(c, df_msg, subject, last_task_name):
 
 	y_right = df_msg.loc[:,('R POR Y [px]')]
 	df_msg.loc[:,('Y')] = y_right
-	
 
-	# Add a table for the subject called Subject + 'RawData'
-	c.execute("CREATE TABLE IF NOT EXISTS ["+ subject +"Rawdata] ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL,[SubjectName] varchar(50) NOT NULL COLLATE NOCASE, [TrialSequence] integer NOT NULL, [Time] integer NOT NULL, [PupilDiaX] float, [PupilDiaY] float, [GazePosX] float, [GazePosY] float, [MousePosX] float, [MousePosY] float, [EventID] integer)")
 
 	# Add data in the following scheme:
 	# SubjectName = subject
@@ -159,11 +372,7 @@ def add_to_sql_emip(c, df_msg, subject, last_task_name):
 	# Time = ' StartTime'
 	# GazePosX = ' X'
 	# GazePosY = ' Y'
-
-	# For each row in the dataframe
-	for index, row in df_msg.iterrows():
-		# Insert the data into the table
-		c.execute("INSERT INTO ["+ subject +"Rawdata] (SubjectName, TrialSequence, Time, GazePosX, GazePosY) VALUES (?, ?, ?, ?, ?)", (subject, trial_to_num_emip[last_task_name], row['Time'], row['X'], row['Y']))
+	prepared['Rawdata'].append((trial_to_num_emip[last_task_name], df_msg['Time'].to_numpy(), df_msg['X'].to_numpy(), df_msg['Y'].to_numpy()))
 
 	trialstarttime = df_msg['Time'].min()
 	# Endtime - Starttime + 4 ms for the duration of the last measuremnt
@@ -173,34 +382,18 @@ def add_to_sql_emip(c, df_msg, subject, last_task_name):
 		print(df_msg)
 
 	trialduration = int(trialduration)
-	c.execute("INSERT INTO Trials (SubjectName, TrialID, TrialName, TrialSequence, Category,  TrialStartTime, Duration) VALUES (?, ?, ?, ?, ?, ?, ?)", (subject, trial_to_num_emip[last_task_name], last_task_name, trial_to_num_emip[last_task_name], "",trialstarttime, trialduration))
+	prepared['Trials'].append((prepared['Subject'], trial_to_num_emip[last_task_name], last_task_name, trial_to_num_emip[last_task_name], "",trialstarttime, trialduration))
 
-def import_data_into_ogama_emip(path, subject, database_path=base_database_path):
+def prepare_subject_emip(path, subject):
 
-	# Check if database exists
-	if not os.path.exists(database_path):
-		raise Exception("Database does not exist")
-	
-	# Load the Tobii eye tracker data into a Pandas DataFrame and skip lines that start with ## as they are comments
-
-	df = None
-	possible_skipped_rows = [37, 32, 41, 45]
-	counter = 0
-	while df is None:
-		try:
-			df = pd.read_csv(path, delimiter='\t', low_memory=False, on_bad_lines='skip', skiprows=possible_skipped_rows[counter])
-			df = df[['Time', 'Type', 'L Raw X [px]', 'L Raw Y [px]', 'R Raw X [px]', 'R Raw Y [px]', 'L Validity', 'R Validity', 'R POR X [px]', 'R POR Y [px]']]
-		except KeyError as e:
-			counter = counter + 1
-			df = None
-			if counter >= len(possible_skipped_rows):
-				print("no possible skipped rows worked", e)
-				break
-		else:
-			break
-
-	df['Type'] = df['Type'].astype(str)
-	df = df.fillna(0.0)
+	# Load the Tobii eye tracker data
+	recording = load_tobii_recording(path)
+	df = pd.DataFrame({
+		'Time': recording['Time'],
+		'R Validity': recording['Validity'],
+		'R POR X [px]': recording['X'],
+		'R POR Y [px]': recording['Y'],
+	})
 
 	# Normalize time
 	df['Time'] = df['Time'] - df['Time'].min()
@@ -209,47 +402,39 @@ def import_data_into_ogama_emip(path, subject, database_path=base_database_path)
 	# Time as integer
 	df['Time'] = df['Time'].astype('int32')
 
-	# Get the row numbers where Type is 'MSG'
-	msg_rows = df[df['Type'] == 'MSG'].index
+	prepared = {'Subject': subject, 'Rawdata': [], 'Trials': []}
 
-	# For each msg_row, split the df into two dataframes, one before the msg_row and one after
-	# Run the analysis for each of those split dataframes as they represent different tasks
-	last_task_name = None
-	last_task_row_number = 0
-	removed_task_names = {
-		'instruction_calibration.jpg': True,
-		'instruction_comprehension.jpg': True,
-	}
+	# Each task runs from its message to the message of the next task
+	for task_name, start, end, is_last in tobii_tasks(recording):
+		df_msg = df[start:end]
+		if is_last:
+			add_to_prepared_emip(prepared, df_msg, task_name)
+		elif task_name is not None and task_name not in removed_task_names:
+			if df_msg.size > 0:
+				add_to_prepared_emip(prepared, df_msg, task_name)
+			else:
+				print("df_msg is empty", task_name, start, end)
 
-	# Connect to database
-	conn = sqlite3.connect(database_path)
-	c = conn.cursor()
+	return prepared
 
-	for msg_row in msg_rows:
-		current_task_name = df['L Raw X [px]'][msg_row].split('Message: ')[1]
-		if '.jpg' in current_task_name:			
-			if last_task_name is not None and last_task_name not in removed_task_names:
-				
-				df_msg = df[last_task_row_number:msg_row]
-				if df_msg.size > 0:
-					add_to_sql_emip(c, df_msg, subject, last_task_name)
-				else:
-					print("df_msg is empty", last_task_name, last_task_row_number, msg_row)
-				
-
-			last_task_name = current_task_name
-			last_task_row_number = msg_row
-
-	df_msg = df[last_task_row_number:]
-	add_to_sql_emip(c, df_msg, subject, last_task_name)
-	
+def import_data_into_ogama_emip(path, subject, database_path=base_database_path):
+
+	# Check if database exists
+	if not os.path.exists(database_path):
+		raise Exception("Database does not exist")
+
+	prepared = prepare_subject(prepare_subject_emip, path, subject)
 
-	# Add subject to the Subjects table
-	c.execute("INSERT INTO Subjects (SubjectName) VALUES (?)", (subject,))
+	# Connect to database
+	conn = connect_for_import(database_path)
+	write_prepared_subject(conn.cursor(), prepared)
 
 	# Save the database
 	conn.commit()
 
+def import_data_into_ogama_emip_batch(paths, subjects, database_path=base_database_path, workers=None):
+	import_subjects_into_ogama(prepare_subject_emip, paths, subjects, database_path, workers)
+
 def drop_all_subject_tables_emip(database_path=base_database_path):
 	# Check if database exists
 	if not os.path.exists(database_path):
@@ -260,9 +445,8 @@ def drop_all_subject_tables_emip(database_path=base_database_path):
 	conn = sqlite3.connect(database_path)
 	c = conn.cursor()
 
-	for i in range(1, 217):
-		# Drop the table named S + str(i) + "RawData"
-		c.execute("DROP TABLE IF EXISTS S" + str(i) + "Rawdata")
+	# Drop the tables named S + str(i) + "RawData"
+	drop_all_rawdata(c, ["S" + str(i) for i in range(1, 217)])
 
 	# Delete entries from Trials
 	c.execute("DELETE FROM Trials")
@@ -355,7 +539,7 @@ def add_to_sql_peitek(c, df_eyetracking, subject_name, task_name, starttime, end
 	
 	# print("Adding data for subject " + subject_name + " to the database...", task_name, starttime, endtime)
 	# Add a table for the subject called Subject + 'RawData'
-	c.execute("CREATE TABLE IF NOT EXISTS ["+ subject_name +"Rawdata] ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL,[SubjectName] varchar(50) NOT NULL COLLATE NOCASE, [TrialSequence] integer NOT NULL, [Time] integer NOT NULL, [PupilDiaX] float, [PupilDiaY] float, [GazePosX] float, [GazePosY] float, [MousePosX] float, [MousePosY] float, [EventID] integer)")
+	create_rawdata_table(c, subject_name)
 
 	# Add data in the following scheme:
 	# SubjectName = subject
@@ -369,10 +553,8 @@ def add_to_sql_peitek(c, df_eyetracking, subject_name, task_name, starttime, end
 		trial_to_num_peitek["current_count"] += 1
 	trial_id = trial_to_num_peitek[task_name]
 	
-	# For each row in the dataframe
-	for index, row in df_eyetracking.iterrows():
-		# Insert the data into the table
-		c.execute("INSERT INTO ["+ subject_name +"Rawdata] (SubjectName, TrialSequence, Time, GazePosX, GazePosY) VALUES (?, ?, ?, ?, ?)", (subject_name, trial_id, row['time'], row['X'], row['Y']))
+	with instrumentation.stage('insert_raw_data', samples=len(df_eyetracking), subject=subject_name, task=task_name):
+		insert_raw_data(c, subject_name, trial_id, df_eyetracking['time'], df_eyetracking['X'], df_eyetracking['Y'])
 
 	starttime = int(starttime * 1000)
 	endtime = int(endtime * 1000)
@@ -389,55 +571,9 @@ def import_data_into_ogama_peitek(df_eyetracking, metadata, database_path=base_d
 	#df_eyetracking["time"] = df_eyetracking["time"].astype(float)
 	#df_eyetracking["time"] = df_eyetracking["time"] - df_eyetracking["time"].iloc[0]
 
-	# drop unused columns
-	df_eyetracking = df_eyetracking.drop(columns=["l_gaze_point_in_user_coordinate_system_x",
-												"l_gaze_point_in_user_coordinate_system_y",
-												"l_gaze_point_in_user_coordinate_system_z",
-												"r_gaze_point_in_user_coordinate_system_x",
-												"r_gaze_point_in_user_coordinate_system_y",
-												"r_gaze_point_in_user_coordinate_system_z",
-												"l_gaze_origin_in_user_coordinate_system_x",
-												"l_gaze_origin_in_user_coordinate_system_y",
-												"l_gaze_origin_in_user_coordinate_system_z",
-												"r_gaze_origin_in_user_coordinate_system_x",
-												"r_gaze_origin_in_user_coordinate_system_y",
-												"r_gaze_origin_in_user_coordinate_system_z"])
-
-	# convert eyetracking data to display coordinates
-	df_eyetracking["l_display_x"] = df_eyetracking["l_display_x"].astype(float) * opt["xres"]
-	df_eyetracking["l_display_y"] = df_eyetracking["l_display_y"].astype(float) * opt["yres"]
-	df_eyetracking["r_display_x"] = df_eyetracking["r_display_x"].astype(float) * opt["xres"]
-	df_eyetracking["r_display_y"] = df_eyetracking["r_display_y"].astype(float) * opt["yres"]
-
-	# convert miss column to right integer used by I2MC
-	df_eyetracking["l_miss_x"] = df_eyetracking.apply(lambda row: row["l_display_x"] < -opt["xres"] or row["l_display_x"] > 2 * opt["xres"], axis=1)
-	df_eyetracking["l_miss_y"] = df_eyetracking.apply(lambda row: row["l_display_y"] < -opt["yres"] or row["l_display_y"] > 2 * opt["yres"], axis=1)
-	df_eyetracking["r_miss_x"] = df_eyetracking.apply(lambda row: row["r_display_x"] < -opt["xres"] or row["r_display_x"] > 2 * opt["xres"], axis=1)
-	df_eyetracking["r_miss_y"] = df_eyetracking.apply(lambda row: row["r_display_y"] < -opt["yres"] or row["r_display_y"] > 2 * opt["yres"], axis=1)
-
-	df_eyetracking["l_miss"] = df_eyetracking.apply(lambda row: row["l_miss_x"] or row["l_miss_y"] or not row["l_valid"] >= 1, axis=1)
-	df_eyetracking["r_miss"] = df_eyetracking.apply(lambda row: row["r_miss_x"] or row["r_miss_y"] or not row["r_valid"] >= 1, axis=1)
-
-	# Set a default value for missing data
-	df_eyetracking.loc[df_eyetracking["l_miss"], "l_display_x"] = opt["missingx"]
-	df_eyetracking.loc[df_eyetracking["l_miss"], "l_display_y"] = opt["missingy"]
-	df_eyetracking.loc[df_eyetracking["r_miss"], "r_display_x"] = opt["missingx"]
-	df_eyetracking.loc[df_eyetracking["r_miss"], "r_display_y"] = opt["missingy"]
-
-	# drop unused columns
-	df_eyetracking = df_eyetracking.drop(columns=["l_miss_x", "l_miss_y", "r_miss_x", "r_miss_y", "l_miss", "r_miss"])
-
-	# rename columns to match I2MC format
-	df_eyetracking.rename(columns={"l_display_x": "L_X",
-								"l_display_y": "L_Y",
-								"r_display_x": "R_X",
-								"r_display_y": "R_Y",
-								"l_valid" : "LValidity",
-								"r_valid" : "RValidity"}, inplace=True)
-	
-	# Add new columns X and Y which are the average of L_X and R_X and L_Y and R_Y
-	df_eyetracking["X"] = (df_eyetracking["L_X"] + df_eyetracking["R_X"]) / 2
-	df_eyetracking["Y"] = (df_eyetracking["L_Y"] + df_eyetracking["R_Y"]) / 2
+	# convert eyetracking data to display coordinates, mark missing samples and average both eyes
+	with instrumentation.stage('to_display_coordinates', samples=len(df_eyetracking)):
+		df_eyetracking = to_display_coordinates(df_eyetracking, opt)
 	
 	# Transform time to ms
 	df_eyetracking["time"] = df_eyetracking["time"].astype(float) * 1000.0
@@ -445,7 +581,7 @@ def import_data_into_ogama_peitek(df_eyetracking, metadata, database_path=base_d
 	df_eyetracking["time"] = df_eyetracking["time"].astype(int)
 
 	# Connect to database
-	conn = sqlite3.connect(database_path)
+	conn = connect_for_import(database_path)
 	c = conn.cursor()
 
 	subject_name = "S" + str(metadata["Participant"])
@@ -471,10 +607,8 @@ def drop_all_subject_tables_peitek(database_path=base_database_path):
 	conn = sqlite3.connect(database_path)
 	c = conn.cursor()
 
-	for i in range(1, 72):
-		# Drop the table named S + str(i) + "RawData"
-		c.execute("DROP TABLE IF EXISTS S" + str(i) + "Rawdata")
-		#c.execute(f"DROP TABLE IF EXISTS {str(i)}Rawdata")
+	# Drop the tables named S + str(i) + "RawData"
+	drop_all_rawdata(c, ["S" + str(i) for i in range(1, 72)])
 
 	# Delete entries from Trials
 	c.execute("DELETE FROM Trials")
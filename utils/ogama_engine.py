@@ -0,0 +1,200 @@
+import os
+import itertools
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.ogama import base_database_path, connect_for_import, insert_chunk_size
+
+# Parameters of the fixation detection like in the fixation options of Ogama
+default_parameters = {
+	'max_distance': 20,  # Maximum distance of a sample from the average fixation position in pixels
+	'min_samples': 5,  # Minimum number of samples of a fixation
+	'max_missed': 3,  # Number of consecutive missing samples after which a fixation ends
+	'screen': (1920, 1080),  # Samples outside of the screen are missing, None only treats NULL and NaN as missing
+}
+
+class Fixation:
+
+	"""Running sums of the samples of a fixation"""
+
+	def __init__(self, time, x, y):
+		self.start_time = time
+		self.end_time = time
+		self.sum_x = x
+		self.sum_y = y
+		self.count = 1
+
+	def add(self, time, x, y):
+		self.end_time = time
+		self.sum_x += x
+		self.sum_y += y
+		self.count += 1
+
+	def distance(self, x, y):
+		return ((self.sum_x / self.count - x)**2 + (self.sum_y / self.count - y)**2)**0.5
+
+
+def missing_samples(x, y, screen=default_parameters['screen']):
+	# A sample is missing if it has no position or lies outside of the screen
+	missing = np.isnan(x) | np.isnan(y)
+	if screen is not None:
+		missing |= (x < 0) | (x > screen[0]) | (y < 0) | (y > screen[1])
+	return missing
+
+
+# The dispersion based algorithm of LC Technologies that Ogama uses: a sample belongs to the present fixation if it
+# lies within a maximum distance of its average position. A sample further away starts a fixation candidate, which only
+# replaces the present fixation once it has the minimum number of samples, so single outliers do not split a fixation
+def detect_fixations_ogama(time, x, y, max_distance=20, min_samples=5, max_missed=3, screen=(1920, 1080)):
+	"""
+	Detects the fixations of one trial.
+
+	Parameters:
+		time (np.ndarray): Time of the samples in ms.
+		x (np.ndarray): Horizontal gaze position in pixels, NaN for missing samples.
+		y (np.ndarray): Vertical gaze position in pixels, NaN for missing samples.
+		max_distance (float): Maximum distance of a sample from the average position of the fixation in pixels.
+		min_samples (int): Minimum number of samples of a fixation, shorter fixations are dropped.
+		max_missed (int): Number of consecutive missing samples after which the present fixation ends.
+		screen (tuple): Width and height of the screen, samples outside of it are missing. None disables the check.
+
+	Returns:
+		list: One (start time, length, x, y) tuple per fixation, the length is the time from the first to the last
+		sample and x and y are the average position of the samples.
+	"""
+	time = np.asarray(time, dtype=np.float64)
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	missing = missing_samples(x, y, screen)
+
+	fixations = []
+	present = None
+	candidate = None
+	missed = 0
+
+	def finish(fixation):
+		if fixation is not None and fixation.count >= min_samples:
+			fixations.append((fixation.start_time, fixation.end_time - fixation.start_time,
+							fixation.sum_x / fixation.count, fixation.sum_y / fixation.count))
+
+	for t, sample_x, sample_y, is_missing in zip(time.tolist(), x.tolist(), y.tolist(), missing.tolist()):
+		# Missing samples end the present fixation once there are too many of them in a row
+		if is_missing:
+			missed += 1
+			if missed > max_missed and present is not None:
+				finish(present)
+				present = None
+				candidate = None
+			continue
+		missed = 0
+
+		if present is None:
+			present = Fixation(t, sample_x, sample_y)
+		elif present.distance(sample_x, sample_y) <= max_distance:
+			# The sample belongs to the present fixation, earlier outliers were noise
+			present.add(t, sample_x, sample_y)
+			candidate = None
+		else:
+			# The sample is outside of the present fixation and belongs to the candidate or starts a new one
+			if candidate is not None and candidate.distance(sample_x, sample_y) <= max_distance:
+				candidate.add(t, sample_x, sample_y)
+			else:
+				candidate = Fixation(t, sample_x, sample_y)
+
+			# The eye moved on once the candidate is long enough to be a fixation itself
+			if candidate.count >= min_samples:
+				finish(present)
+				present = candidate
+				candidate = None
+
+	finish(present)
+	return fixations
+
+
+def read_trials(conn, subject):
+	# TrialID and TrialStartTime of each TrialSequence of the subject
+	c = conn.execute("SELECT TrialSequence, TrialID, TrialStartTime FROM Trials WHERE SubjectName = ?", (subject,))
+	return {trial_sequence: (trial_id, trial_start_time) for trial_sequence, trial_id, trial_start_time in c}
+
+
+def subject_fixations(database_path, subject, parameters=default_parameters):
+	"""
+	Detects the fixations of all trials of a subject.
+
+	Returns:
+		list: The rows of the GazeFixations table without ID, the start time is relative to the start of the trial.
+	"""
+	parameters = dict(default_parameters, **parameters)
+	conn = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True, timeout=60)
+	trials = read_trials(conn, subject)
+
+	rows = []
+	c = conn.execute("SELECT TrialSequence, Time, GazePosX, GazePosY FROM [" + subject + "Rawdata] ORDER BY ID")
+	# The samples of a trial are imported in one block, so they are grouped in the order of the table
+	for trial_sequence, samples in itertools.groupby(c, key=lambda row: row[0]):
+		samples = np.array([sample[1:] for sample in samples], dtype=np.float64)
+		trial_id, trial_start_time = trials.get(trial_sequence, (trial_sequence, 0))
+		fixations = detect_fixations_ogama(samples[:, 0], samples[:, 1], samples[:, 2], **parameters)
+		for count_in_trial, (start_time, length, x, y) in enumerate(fixations, start=1):
+			rows.append((subject, trial_id, trial_sequence, count_in_trial, int(round(start_time - (trial_start_time or 0))), int(round(length)), x, y))
+	conn.close()
+	return rows
+
+
+def list_subjects(database_path):
+	# Subjects that have a raw data table, or a view on the single raw data table
+	conn = sqlite3.connect(database_path)
+	tables = {name.lower() for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+	subjects = [subject for (subject,) in conn.execute("SELECT SubjectName FROM Subjects ORDER BY ID") if (subject + 'Rawdata').lower() in tables]
+	conn.close()
+	return subjects
+
+
+def write_gaze_fixations(c, subject, rows):
+	# Replace the fixations of the subject
+	c.execute("CREATE TABLE IF NOT EXISTS GazeFixations ([ID] integer PRIMARY KEY AUTOINCREMENT NOT NULL, [SubjectName] varchar(50) NOT NULL COLLATE NOCASE, [TrialID] integer NOT NULL, [TrialSequence] integer NOT NULL, [CountInTrial] integer, [StartTime] integer, [Length] integer, [PosX] float, [PosY] float)")
+	c.execute("DELETE FROM GazeFixations WHERE SubjectName = ?", (subject,))
+	query = "INSERT INTO GazeFixations (SubjectName, TrialID, TrialSequence, CountInTrial, StartTime, Length, PosX, PosY) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+	for start in range(0, len(rows), insert_chunk_size):
+		c.executemany(query, rows[start:start + insert_chunk_size])
+
+
+# Stand-in for the fixation calculation of Ogama, so calculate_results_for_subject_* work without an Ogama installation
+def calculate_fixations(database_path=base_database_path, subjects=None, parameters=default_parameters, workers=None):
+	"""
+	Calculates the fixations of the subjects like Ogama from the raw data and Trials tables written by the
+	import_data_into_ogama_* functions and writes them to the GazeFixations table.
+	The subjects are analysed in a process pool and written by this process, each subject is committed on its own.
+
+	Parameters:
+		database_path (str): The Ogama database with the imported raw data.
+		subjects (list): The subjects, e.g. ['S1', 'S2'], None calculates the fixations of all imported subjects.
+		parameters (dict): Parameters of detect_fixations_ogama, missing ones are taken from default_parameters.
+		workers (int): Number of processes calculating the fixations, None calculates them one after another.
+	"""
+	# Check if database exists
+	if not os.path.exists(database_path):
+		raise Exception("Database does not exist")
+
+	if subjects is None:
+		subjects = list_subjects(database_path)
+
+	conn = connect_for_import(database_path)
+	# Wait for the worker processes that are still reading raw data instead of failing
+	conn.execute("PRAGMA busy_timeout = 60000")
+	c = conn.cursor()
+
+	def store(subject_rows):
+		for subject, rows in zip(subjects, subject_rows):
+			write_gaze_fixations(c, subject, rows)
+			# Save the database
+			conn.commit()
+			print('Calculated fixations for subject ' + subject)
+
+	if workers is None or workers <= 1:
+		store(subject_fixations(database_path, subject, parameters) for subject in subjects)
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			store(executor.map(subject_fixations, itertools.repeat(database_path), subjects, itertools.repeat(parameters)))
+
+	conn.close()
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from utils.peitek_opt import opt
+
+# Columns of the Peitek eye tracking files that are not used by the analyses
+unused_columns = ["l_gaze_point_in_user_coordinate_system_x",
+				"l_gaze_point_in_user_coordinate_system_y",
+				"l_gaze_point_in_user_coordinate_system_z",
+				"r_gaze_point_in_user_coordinate_system_x",
+				"r_gaze_point_in_user_coordinate_system_y",
+				"r_gaze_point_in_user_coordinate_system_z",
+				"l_gaze_origin_in_user_coordinate_system_x",
+				"l_gaze_origin_in_user_coordinate_system_y",
+				"l_gaze_origin_in_user_coordinate_system_z",
+				"r_gaze_origin_in_user_coordinate_system_x",
+				"r_gaze_origin_in_user_coordinate_system_y",
+				"r_gaze_origin_in_user_coordinate_system_z"]
+
+# Columns of the Peitek eye tracking files that are used by the analyses and their types
+# (the validity is read as float, so empty cells become NaN and count as missing)
+eyetracking_dtypes = {
+	"time": np.float64,
+	"l_display_x": np.float64,
+	"l_display_y": np.float64,
+	"r_display_x": np.float64,
+	"r_display_y": np.float64,
+	"l_valid": np.float64,
+	"r_valid": np.float64,
+}
+
+# Columns of the behavioral data that describe a trial
+trial_columns = ["Participant", "Algorithm", "Behavioral", "StartTime", "EndTime", "Duration", "IsOutlier", "SkillScore"]
+
+# Arrays of the fixations of a trial and their columns in the fixation csv files
+fixation_columns = {"StartT": "Fixation_startT",
+					"EndT": "Fixation_endT",
+					"X": "Fixation_x",
+					"Y": "Fixation_y",
+					"XRange": "Fixation_x_range",
+					"YRange": "Fixation_y_range"}
+
+
+def read_eyetracking_csv(path, chunksize=None):
+	"""
+	Reads only the columns in eyetracking_dtypes of a Peitek eye tracking file.
+
+	Parameters:
+		path (str): The eye tracking csv file of a trial.
+		chunksize (int): Number of rows per DataFrame when iterating over a long trial, None reads the whole file.
+
+	Returns:
+		pd.DataFrame: The eye tracking data, or an iterator over DataFrames with chunksize rows if chunksize is set.
+	"""
+	return pd.read_csv(path, usecols=list(eyetracking_dtypes), dtype=eyetracking_dtypes, chunksize=chunksize)
+
+
+def missing_mask(x, y, valid, opt=opt):
+	# A sample of an eye is missing for I2MC if it is more than one screen outside of the display or not valid,
+	# a NaN validity is not >= 1 and so missing as well
+	miss_x = (x < -opt["xres"]) | (x > 2 * opt["xres"])
+	miss_y = (y < -opt["yres"]) | (y > 2 * opt["yres"])
+	return miss_x | miss_y | ~(valid >= 1)
+
+
+def to_display_coordinates(df_eyetracking, opt=opt):
+	"""
+	Converts Peitek eye tracking data to display coordinates in the I2MC format.
+
+	Parameters:
+		df_eyetracking (pd.DataFrame): The eye tracking data with the normalized display coordinates and the validity of both eyes.
+		opt (dict): The I2MC options, xres and yres are the display size, missingx and missingy mark missing samples.
+
+	Returns:
+		pd.DataFrame: The data with L_X, L_Y, R_X, R_Y in pixels, LValidity, RValidity and X, Y as average of both eyes.
+	"""
+	# drop unused columns, read_eyetracking_csv does not read them at all
+	df_eyetracking = df_eyetracking.drop(columns=unused_columns, errors='ignore')
+
+	# convert eyetracking data to display coordinates and set a default value for missing data
+	for eye in ["l", "r"]:
+		x = df_eyetracking[eye + "_display_x"].to_numpy(dtype=float) * opt["xres"]
+		y = df_eyetracking[eye + "_display_y"].to_numpy(dtype=float) * opt["yres"]
+		miss = missing_mask(x, y, df_eyetracking[eye + "_valid"].to_numpy(), opt)
+		df_eyetracking[eye + "_display_x"] = np.where(miss, opt["missingx"], x)
+		df_eyetracking[eye + "_display_y"] = np.where(miss, opt["missingy"], y)
+
+	# rename columns to match I2MC format
+	df_eyetracking.rename(columns={"l_display_x": "L_X",
+								"l_display_y": "L_Y",
+								"r_display_x": "R_X",
+								"r_display_y": "R_Y",
+								"l_valid" : "LValidity",
+								"r_valid" : "RValidity"}, inplace=True)
+
+	# Add new columns X and Y which are the average of L_X and R_X and L_Y and R_Y
+	df_eyetracking["X"] = (df_eyetracking["L_X"] + df_eyetracking["R_X"]) / 2
+	df_eyetracking["Y"] = (df_eyetracking["L_Y"] + df_eyetracking["R_Y"]) / 2
+
+	return df_eyetracking
+
+
+def save_fixations(path, df_trials, fixations):
+	"""
+	Saves fixations as long-form table with one row per fixation in a npz file.
+
+	Parameters:
+		path (str): The npz file.
+		df_trials (pd.DataFrame): One row per trial with the trial_columns.
+		fixations (list): For each trial a dict with the arrays StartT, EndT, X, Y, XRange and YRange.
+	"""
+	df_trials = df_trials[trial_columns].infer_objects()
+	arrays = {}
+	for column in trial_columns:
+		values = df_trials[column].to_numpy()
+		# Text columns are stored as unicode arrays, npz files can not hold Python objects without pickle
+		if values.dtype == object:
+			values = values.astype(str)
+		arrays["Trial" + column] = values
+
+	# Each fixation has the index of its trial and the participant and algorithm as keys
+	counts = np.array([len(trial["StartT"]) for trial in fixations], dtype=np.int64)
+	trial_index = np.repeat(np.arange(len(fixations), dtype=np.int64), counts)
+	arrays["Trial"] = trial_index
+	arrays["Participant"] = arrays["TrialParticipant"][trial_index]
+	arrays["Algorithm"] = arrays["TrialAlgorithm"][trial_index]
+	arrays["FixationNumber"] = np.arange(len(trial_index), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+	for name in fixation_columns:
+		arrays[name] = np.concatenate([np.asarray(trial[name], dtype=np.float64) for trial in fixations] + [np.empty(0)])
+
+	with open(path, 'wb') as f:
+		np.savez(f, **arrays)
+
+
+def load_fixation_table(path):
+	"""Returns the fixations saved by save_fixations as DataFrame with one row per fixation"""
+	with np.load(path, allow_pickle=False) as data:
+		return pd.DataFrame({name: data[name] for name in ["Trial", "Participant", "Algorithm", "FixationNumber"] + list(fixation_columns)})
+
+
+def load_fixations(path):
+	"""
+	Loads fixations saved by save_fixations.
+
+	Returns:
+		pd.DataFrame: One row per trial with the trial_columns.
+		list: For each trial (row of the DataFrame) a dict with the arrays StartT, EndT, X, Y, XRange and YRange.
+	"""
+	with np.load(path, allow_pickle=False) as data:
+		df_trials = pd.DataFrame({column: data["Trial" + column] for column in trial_columns})
+		# The fixations are sorted by trial, so each trial is one slice of the arrays
+		ends = np.searchsorted(data["Trial"], np.arange(len(df_trials)), side='right')
+		columns = {name: np.split(data[name], ends[:-1]) for name in fixation_columns}
+
+	fixations = [{name: columns[name][index] for name in fixation_columns} for index in range(len(df_trials))]
+	return df_trials, fixations
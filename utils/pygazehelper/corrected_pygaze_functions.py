@@ -9,10 +9,118 @@ def remove_missing(x, y, time, missing):
 	return x.reset_index(drop=True), y.reset_index(drop=True), time.reset_index(drop=True)
 
 
+def remove_missing_arrays(x, y, time, missing):
+	"""Array version of remove_missing: returns contiguous numpy arrays
+	without the samples where both x and y are missing; contiguous arrays
+	without missing samples are returned as they are, without a copy"""
+	x = numpy.ascontiguousarray(x)
+	y = numpy.ascontiguousarray(y)
+	time = numpy.ascontiguousarray(time)
+	keep = (x != missing) | (y != missing)
+	if keep.all():
+		return x, y, time
+	return x[keep], y[keep], time[keep]
+
+
+def _distance(dx, dy):
+	"""Euclidean distances like in the sample loop, where a squared distance
+	that is not positive (this includes NaN) counts as a distance of 0"""
+	squared_distance = dx**2 + dy**2
+	return numpy.where(squared_distance > 0, numpy.sqrt(squared_distance), 0.0)
+
+
+def _first_outside(x, y, si, maxdist, block=32):
+	"""Returns the index of the first sample after si that lies further than
+	maxdist away from sample si, or len(x) if there is no such sample.
+	The samples are compared block-wise with growing block sizes, so that
+	short fixations only look at a few samples and long ones need only a
+	few numpy calls"""
+	start = si + 1
+	while start < len(x):
+		end = min(start + block, len(x))
+		dist = _distance(x[si]-x[start:end], y[si]-y[start:end])
+		outside = numpy.flatnonzero(dist > maxdist)
+		if len(outside) > 0:
+			return start + int(outside[0])
+		start = end
+		block *= 2
+	return len(x)
+
+
 def fixation_detection_fixed(x, y, time, missing=0.0, maxdist=25, mindur=50):
 	
 	"""Detects fixations, defined as consecutive samples with an inter-sample
 	distance of less than a set amount of pixels (disregarding missing data)
+
+	Vectorized engine with the same output as fixation_detection_fixed_reference:
+	fixation starts are looked up in the precomputed inter-sample distances,
+	fixation ends are found block-wise from the fixation anchor
+	
+	arguments
+
+	x		-	numpy array (or pandas Series) of x positions
+	y		-	numpy array (or pandas Series) of y positions
+	time		-	numpy array (or pandas Series) of EyeTribe timestamps
+
+	keyword arguments
+
+	missing	-	value to be used for missing data (default = 0.0)
+	maxdist	-	maximal inter sample distance in pixels (default = 25)
+	mindur	-	minimal duration of a fixation in milliseconds; detected
+				fixation cadidates will be disregarded if they are below
+				this duration (default = 100)
+	
+	returns
+	Sfix, Efix
+				Sfix	-	list of lists, each containing [starttime]
+				Efix	-	list of lists, each containing [starttime, endtime, duration, endx, endy]
+	"""
+
+	x, y, time = remove_missing_arrays(x, y, time, missing)
+
+	# empty list to contain data
+	Sfix = []
+	Efix = []
+
+	# indices i where sample i is close enough to sample i-1; outside of a
+	# fixation a new one starts at the first of those
+	starts = numpy.flatnonzero(_distance(numpy.diff(x), numpy.diff(y)) <= maxdist) + 1
+
+	i = 1
+	si = 0
+	while True:
+		# start a new fixation at the next close sample
+		pos = numpy.searchsorted(starts, i)
+		if pos == len(starts):
+			break
+		si = int(starts[pos])
+		Sfix.append([time[si]])
+
+		# the fixation ends at the first sample too far away from its start
+		i = _first_outside(x, y, si, maxdist)
+		if i == len(x):
+			break
+		# only store the fixation if the duration is ok
+		if time[i-1]-Sfix[-1][0] >= mindur:
+			Efix.append([Sfix[-1][0], time[i-1], time[i-1]-Sfix[-1][0], x[si], y[si]])
+		# delete the last fixation start if it was too short
+		else:
+			Sfix.pop(-1)
+		# the sample that ended the fixation is compared with the next one
+		i = i + 1
+
+	#add last fixation end (we can lose it if dist > maxdist is false for the last point)
+	if len(Sfix) > len(Efix):
+		Efix.append([Sfix[-1][0], time[len(x)-1], time[len(x)-1]-Sfix[-1][0], x[si], y[si]])
+	return Sfix, Efix
+
+
+def fixation_detection_fixed_reference(x, y, time, missing=0.0, maxdist=25, mindur=50):
+	
+	"""Detects fixations, defined as consecutive samples with an inter-sample
+	distance of less than a set amount of pixels (disregarding missing data)
+
+	Sample-by-sample reference implementation of fixation_detection_fixed
 	
 	arguments
 
@@ -77,10 +185,339 @@ def fixation_detection_fixed(x, y, time, missing=0.0, maxdist=25, mindur=50):
 		Efix.append([Sfix[-1][0], time[len(x)-1], time[len(x)-1]-Sfix[-1][0], x[si], y[si]])
 	return Sfix, Efix
 
+class StreamingFixationDetector:
+
+	"""Detects fixations in a stream of samples, e.g. live gaze data, with
+	the same definition as fixation_detection_fixed: all fixations returned
+	by push and flush together equal its Efix for all samples pushed so far
+
+	Each sample takes constant time and only the anchor of the current
+	fixation and the previous sample are kept
+
+	keyword arguments
+
+	missing	-	value to be used for missing data (default = 0.0)
+	maxdist	-	maximal inter sample distance in pixels (default = 25)
+	mindur	-	minimal duration of a fixation in milliseconds; detected
+				fixation cadidates will be disregarded if they are below
+				this duration (default = 50)
+	"""
+
+	def __init__(self, missing=0.0, maxdist=25, mindur=50):
+		self.missing = missing
+		self.maxdist = maxdist
+		self.mindur = mindur
+		self.reset()
+
+	def reset(self):
+		"""Forgets all samples, e.g. before the next trial"""
+		# the sample new samples are compared with: the start of the current
+		# fixation, or the previous sample outside of a fixation
+		self.anchor_x = None
+		self.anchor_y = None
+		# starttime of the current fixation, None outside of a fixation
+		self.fixation_start = None
+		# time of the previous sample that was not missing
+		self.last_time = None
+
+	def push(self, x, y, time):
+
+		"""Adds a sample or arrays of samples
+
+		arguments
+
+		x		-	x position or numpy array of x positions
+		y		-	y position or numpy array of y positions
+		time		-	timestamp or numpy array of timestamps
+
+		returns
+		Efix
+				Efix	-	list of the fixations that ended, each containing
+						[starttime, endtime, duration, endx, endy]
+		"""
+
+		Efix = []
+		for sx, sy, st in zip(numpy.atleast_1d(x), numpy.atleast_1d(y), numpy.atleast_1d(time)):
+			# disregard missing data
+			if sx == self.missing and sy == self.missing:
+				continue
+			# the first sample is only the anchor for the next one
+			if self.anchor_x is None:
+				self.anchor_x, self.anchor_y, self.last_time = sx, sy, st
+				continue
+
+			# calculate Euclidean distance from the current fixation coordinate
+			squared_distance = (self.anchor_x-sx)**2 + (self.anchor_y-sy)**2
+			dist = 0.0
+			if squared_distance > 0:
+				dist = squared_distance**0.5
+
+			if self.fixation_start is None:
+				# start a new fixation if the sample is close to the previous one
+				if dist <= self.maxdist:
+					self.fixation_start = st
+				self.anchor_x, self.anchor_y = sx, sy
+			elif dist > self.maxdist:
+				# end the current fixation, only store it if the duration is ok
+				if self.last_time-self.fixation_start >= self.mindur:
+					Efix.append([self.fixation_start, self.last_time, self.last_time-self.fixation_start, self.anchor_x, self.anchor_y])
+				self.fixation_start = None
+				self.anchor_x, self.anchor_y = sx, sy
+			self.last_time = st
+		return Efix
+
+	def flush(self):
+
+		"""Ends the stream: returns the current fixation like fixation_detection_fixed
+		does at the end of the data and resets the detector
+
+		returns
+		Efix
+				Efix	-	list with the current fixation, empty if there is none
+		"""
+
+		Efix = []
+		if self.fixation_start is not None:
+			Efix.append([self.fixation_start, self.last_time, self.last_time-self.fixation_start, self.anchor_x, self.anchor_y])
+		self.reset()
+		return Efix
+
+
 def saccade_detection_fixed(x, y, time, missing=0.0, minlen=5, maxvel=40, maxacc=340):
 	
 	"""Detects saccades, defined as consecutive samples with an inter-sample
 	velocity of over a velocity threshold or an acceleration threshold
+
+	Single-pass engine with the same output as saccade_detection_fixed_reference:
+	the threshold masks are computed once and the saccade start/end pairs are
+	derived from their edges
+	
+	arguments
+
+	x		-	numpy array (or pandas Series) of x positions
+	y		-	numpy array (or pandas Series) of y positions
+	time		-	numpy array (or pandas Series) of tracker timestamps in milliseconds
+
+	keyword arguments
+
+	missing	-	value to be used for missing data (default = 0.0)
+	minlen	-	minimal length of saccades in milliseconds; all detected
+				saccades with len(sac) < minlen will be ignored
+				(default = 5)
+	maxvel	-	velocity threshold in pixels/second (default = 40)
+	maxacc	-	acceleration threshold in pixels / second**2
+				(default = 340)
+	
+	returns
+	Ssac, Esac
+			Ssac	-	list of lists, each containing [starttime]
+			Esac	-	list of lists, each containing [starttime, endtime, duration, startx, starty, endx, endy]
+	"""
+	x, y, time = remove_missing_arrays(x, y, time, missing)
+
+	# INTER-SAMPLE MEASURES
+	# the distance between samples is the square root of the sum
+	# of the squared horizontal and vertical interdistances
+	intdist = (numpy.diff(x)**2 + numpy.diff(y)**2)**0.5
+	# get inter-sample times
+	inttime = numpy.diff(time)
+
+	# recalculate inter-sample times to seconds
+	inttime = inttime / 1000.0
+
+	# VELOCITY AND ACCELERATION
+	# the velocity between samples is the inter-sample distance
+	# divided by the inter-sample time
+	vel = intdist / inttime
+	# the acceleration is the sample-to-sample difference in
+	# eye movement velocity
+	acc = numpy.diff(vel)
+
+	# THRESHOLD MASKS
+	# saccade start (t1) is when the velocity or acceleration
+	# surpass threshold, saccade end (t2) is when both return
+	# under threshold
+	starts = numpy.flatnonzero((vel[1:] > maxvel) | (acc > maxacc))
+	ends = numpy.flatnonzero((vel[1:] < maxvel) & (acc < maxacc))
+
+	# for every possible start: its start index, the index of the first end
+	# after it and the position of the first possible start after that end
+	t1i = numpy.minimum(starts + 1, len(time)-2)
+	endpos = numpy.searchsorted(ends, t1i)
+	closed = endpos < len(ends)
+	t2i = numpy.full(len(starts), len(time)-1)
+	t2i[closed] = numpy.minimum(ends[endpos[closed]] + 1 + 2, len(time)-1)
+	nextpos = numpy.searchsorted(starts, t2i)
+
+	# SACCADE START AND END
+	# follow the chain of saccades from the first possible start
+	chain = []
+	pos = 0
+	closed = closed.tolist()
+	nextpos = nextpos.tolist()
+	while pos < len(starts):
+		chain.append(pos)
+		if not closed[pos]:
+			break
+		pos = nextpos[pos]
+
+	# a saccade without an end only keeps its start
+	unclosed = []
+	if len(chain) > 0 and not closed[chain[-1]]:
+		unclosed = [[time[t1i[chain.pop(-1)]]]]
+
+	# ignore saccades that did not last long enough
+	t1i = t1i[chain]
+	t2i = t2i[chain]
+	dur = time[t2i] - time[t1i]
+	t1i = t1i[dur >= minlen]
+	t2i = t2i[dur >= minlen]
+
+	Ssac = [[time[i1]] for i1 in t1i] + unclosed
+	Esac = [[time[i1], time[i2], time[i2] - time[i1], x[i1], y[i1], x[i2], y[i2]] for i1, i2 in zip(t1i, t2i)]
+
+	return Ssac, Esac
+
+class StreamingSaccadeDetector:
+
+	"""Detects saccades in a stream of samples with the same definition as
+	saccade_detection_fixed: all saccades returned by push and flush together
+	equal its Ssac and Esac for all samples pushed so far
+
+	Only the last two samples, the last velocity and the current saccade
+	are kept, so memory does not grow with the length of the recording
+
+	keyword arguments
+
+	missing	-	value to be used for missing data (default = 0.0)
+	minlen	-	minimal length of saccades in milliseconds; all detected
+				saccades with len(sac) < minlen will be ignored
+				(default = 5)
+	maxvel	-	velocity threshold in pixels/second (default = 40)
+	maxacc	-	acceleration threshold in pixels / second**2
+				(default = 340)
+	"""
+
+	def __init__(self, missing=0.0, minlen=5, maxvel=40, maxacc=340):
+		self.missing = missing
+		self.minlen = minlen
+		self.maxvel = maxvel
+		self.maxacc = maxacc
+		self.reset()
+
+	def reset(self):
+		"""Forgets all samples, e.g. before the next trial"""
+		# number of samples that were not missing
+		self.count = 0
+		# previous sample and the velocity between the two samples before
+		self.previous = None
+		self.previous_vel = None
+		# index from which saccade starts are searched (t0i)
+		self.t0i = 0
+		# start of the current saccade as (index, time, x, y), None if there is none
+		self.start = None
+		# index of the end sample of the current saccade, None if its end was not found yet
+		self.t2i = None
+
+	def _end_saccade(self, t2, x2, y2, Ssac, Esac):
+		t1i, t1, x1, y1 = self.start
+		dur = t2 - t1
+		# ignore saccades that did not last long enough
+		if dur >= self.minlen:
+			Ssac.append([t1])
+			Esac.append([t1, t2, dur, x1, y1, x2, y2])
+		self.start = None
+		self.t2i = None
+
+	def push(self, x, y, time):
+
+		"""Adds a sample or arrays of samples
+
+		arguments
+
+		x		-	x position or numpy array of x positions
+		y		-	y position or numpy array of y positions
+		time		-	timestamp or numpy array of timestamps in milliseconds
+
+		returns
+		Ssac, Esac
+				Ssac	-	list of the starts of the saccades that ended, each containing [starttime]
+				Esac	-	list of the saccades that ended, each containing
+						[starttime, endtime, duration, startx, starty, endx, endy]
+		"""
+
+		Ssac = []
+		Esac = []
+		for sx, sy, st in zip(numpy.atleast_1d(x), numpy.atleast_1d(y), numpy.atleast_1d(time)):
+			# disregard missing data
+			if sx == self.missing and sy == self.missing:
+				continue
+			k = self.count
+			self.count += 1
+
+			vel = None
+			if self.previous is not None:
+				# velocity between the previous and this sample, computed like
+				# the inter-sample measures of saccade_detection_fixed
+				px, py, pt = self.previous
+				intdist = ((sx-px)**2 + (sy-py)**2)**0.5
+				inttime = (st-pt) / 1000.0
+				vel = intdist / inttime
+
+			# the current saccade ends with this sample
+			if self.t2i == k:
+				self._end_saccade(st, sx, sy, Ssac, Esac)
+				self.t0i = k
+
+			# with this sample the thresholds of index j = k-2 are known
+			if self.previous_vel is not None:
+				j = k - 2
+				acc = vel - self.previous_vel
+				if self.start is None and j >= self.t0i:
+					# saccade start (t1) is when the velocity or acceleration surpass threshold
+					if vel > self.maxvel or acc > self.maxacc:
+						self.start = (j + 1, pt, px, py)
+				elif self.start is not None and self.t2i is None and j >= self.start[0]:
+					# saccade end (t2) is two samples after both return under threshold
+					if vel < self.maxvel and acc < self.maxacc:
+						self.t2i = j + 1 + 2
+
+			self.previous = (sx, sy, st)
+			self.previous_vel = vel
+		return Ssac, Esac
+
+	def flush(self):
+
+		"""Ends the stream: returns the current saccade like saccade_detection_fixed
+		does at the end of the data and resets the detector
+
+		returns
+		Ssac, Esac
+				Ssac	-	list with the start of the current saccade, also if it has no end
+				Esac	-	list with the current saccade if its end was found
+		"""
+
+		Ssac = []
+		Esac = []
+		if self.start is not None:
+			if self.t2i is not None:
+				# the end lies behind the data, the last sample is used instead
+				sx, sy, st = self.previous
+				self._end_saccade(st, sx, sy, Ssac, Esac)
+			else:
+				# a saccade without an end only keeps its start
+				Ssac.append([self.start[1]])
+		self.reset()
+		return Ssac, Esac
+
+
+def saccade_detection_fixed_reference(x, y, time, missing=0.0, minlen=5, maxvel=40, maxacc=340):
+	
+	"""Detects saccades, defined as consecutive samples with an inter-sample
+	velocity of over a velocity threshold or an acceleration threshold
+
+	Reference implementation of saccade_detection_fixed, which scans the
+	remaining samples again after every saccade
 	
 	arguments
 
@@ -1,10 +1,25 @@
 import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
+from utils import cache
+from utils import instrumentation
+from utils.recordings import load_tobii_recording, tobii_tasks, load_sharafi_recording, removed_task_names
 from utils.pygazehelper.corrected_pygaze_functions import fixation_detection_fixed, saccade_detection_fixed
 
+# Increase when the results of the analyses change, so that results stored in a shard directory are computed again
+analysis_version = 1
+# Number of recordings after which the manifest of a shard directory is written, it is always written at the end
+manifest_interval = 100
+# Parameters of the fixation detection if none are given, the last task of a Tobii recording is always analysed with them
+default_fixation_parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}
 
-def call_fixation_detection_on_data(fixation_info, participant, time, x, y, task = 0, parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
+
+def call_fixation_detection_on_data(fixation_info, participant, time, x, y, task = 0, parameters = default_fixation_parameters):
 	missing = parameters['missing']  # Missing value threshold 
 	maxdist = parameters['maxdist']  # Maximum distance for a fixation 
 	mindur = parameters['mindur']  # Minimum duration for a fixation
@@ -48,127 +63,112 @@ def call_saccade_detection_on_data(saccade_info, participant, time, x, y, task =
     saccade_info['Average Saccade Distance [px]'].append(average_distance)
 
 
-def prepare_tobii_data(directory_path, file_name, fixation_info, fn, parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
+def load_tobii_segments(directory_path, file_name):
+	"""
+	Loads a Tobii TSV file and splits it into the tasks of the recording.
+
+	Returns:
+		list: One (participant, task, time, x, y, with_parameters) tuple per task. with_parameters is False for the
+		last task of the recording, which has always been analysed with the default parameters of the detection function.
+	"""
 	tsv_file = os.path.join(directory_path, file_name)
+	recording = load_tobii_recording(tsv_file)
+	participant_id = file_name.split('_')[0]
 
-	# Load the Tobii eye tracker data into a Pandas DataFrame and skip lines that start with ## as they are comments
-
-	df = None
-	# Tobii data files have different number of rows to skip at the beginning of the file
-	# Try different row numbers to skip until the data is loaded successfully
-	possible_skipped_rows = [37, 32, 41, 45]
-	counter = 0
-	while df is None:
-		try:
-			df = pd.read_csv(tsv_file, delimiter='\t', low_memory=False, on_bad_lines='skip', skiprows=possible_skipped_rows[counter])
-			df = df[['Time', 'Type', 'L Raw X [px]', 'L Raw Y [px]', 'R Raw X [px]', 'R Raw Y [px]', 'L Validity', 'R Validity', 'R POR X [px]', 'R POR Y [px]']]
-		except KeyError as e:
-			counter = counter + 1
-			df = None
-			if counter >= len(possible_skipped_rows):
-				print("no possible skipped rows worked", e)
-				break
-		else:
-			break
-
-	df['Type'] = df['Type'].astype(str)
-	df = df.fillna(0.0)
-
-	# Get the row numbers where Type is 'MSG'
-	msg_rows = df[df['Type'] == 'MSG'].index
-
-	# For each msg_row, split the df into two dataframes, one before the msg_row and one after
-	# Run the analysis for each of those split dataframes as they represent different tasks
-	last_task_name = None
-	last_task_row_number = 0
-	# Ignore the instruction tasks
-	removed_task_names = {
-		'instruction_calibration.jpg': True,
-		'instruction_comprehension.jpg': True,
-	}
-
-	for msg_row in msg_rows:
-		current_task_name = df['L Raw X [px]'][msg_row].split('Message: ')[1]
-		# If the current task is an image name, it means that the current task has ended
-		if '.jpg' in current_task_name:			
-			if last_task_name is not None and last_task_name not in removed_task_names:
-				
-				df_msg = df[last_task_row_number:msg_row]
-				# Remove all rows where the eye is invalid
-				df_msg = df_msg[(df_msg['R Validity'] == 1)]
-
-				# Define parameters for fixation detection
-				x_right = df_msg.loc[:,('R POR X [px]')]
-				df_msg.loc[:,('X')] = x_right
-
-				y_left = df_msg['L Raw Y [px]']
-				y_right = df_msg.loc[:,('R POR Y [px]')]
-				df_msg.loc[:,('Y')] = y_right
-
-				# Normalize time
-				time = df_msg['Time'] - df_msg['Time'].min()
-				# Time conversion from microseconds to milliseconds
-				time = time / 1000
-
-				participant_id = file_name.split('_')[0]
-				fn(fixation_info, participant_id, time, x_right, y_right, last_task_name, parameters)
-
-			last_task_name = current_task_name
-			last_task_row_number = msg_row
-
-		
-	df_msg = df[last_task_row_number:]
-	# Remove all rows at least one eye is invalid
-	df_msg = df_msg[(df_msg['R Validity'] == 1)]
-
-	# Define parameters for fixation detection
-	x_left = df_msg['L Raw X [px]'].astype(float)
-	x_right = df_msg['R POR X [px]'] 
-	x = (x_left + x_right) / 2
-
-	y_left = df_msg['L Raw Y [px]']
-	y_right = df_msg['R POR Y [px]']
-	y = (y_left + y_right) / 2
-	# Normalize time
-	time = df_msg['Time'] - df_msg['Time'].min()
-	# Time conversion from microseconds to milliseconds
-	time = time / 1000
+	# Split the recording at the messages of the tasks
+	with instrumentation.stage('segment_tobii', tsv_file, len(recording['Time'])):
+		segments = []
+		for task_name, start, end, is_last in tobii_tasks(recording):
+			# Ignore the rows before the first task and the instruction tasks, the last task is always analysed
+			if not is_last and (task_name is None or task_name in removed_task_names):
+				continue
 
-	participant_id = file_name.split('_')[0]
-	fn(fixation_info, participant_id, time, x_right, y_right, last_task_name)
+			# Remove all rows where the eye is invalid
+			valid = recording['Validity'][start:end] == 1
 
+			# Define parameters for fixation detection
+			x_right = recording['X'][start:end][valid]
+			y_right = recording['Y'][start:end][valid]
 
+			# The masked arrays are copies, so the time is converted in place
+			time = recording['Time'][start:end][valid]
+			# Normalize time
+			if len(time) > 0:
+				time -= time.min()
+			# Time conversion from microseconds to milliseconds
+			time /= 1000
 
-def prepare_txt_data(directory_path, file_name, fixation_info, fn, parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
+			segments.append((participant_id, task_name, time, x_right, y_right, not is_last))
+
+	return segments
+
+
+def call_on_segments(segments, fixation_info, fn, parameters):
+	for participant, task, time, x, y, with_parameters in segments:
+		with instrumentation.stage(fn.__name__, samples=len(time), task=task):
+			if with_parameters:
+				fn(fixation_info, participant, time, x, y, task, parameters)
+			else:
+				fn(fixation_info, participant, time, x, y, task)
+
+
+def prepare_tobii_data(directory_path, file_name, fixation_info, fn, parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
+	call_on_segments(load_tobii_segments(directory_path, file_name), fixation_info, fn, parameters)
+
+
+def fill_missing(values):
+	# Replace missing values with 0.0 in place
+	if values.dtype.kind == 'f':
+		values[np.isnan(values)] = 0.0
+	return values
+
+
+def load_txt_segments(directory_path, file_name):
+	"""
+	Loads an ogama txt file of Sharafi et al. and splits it into the shown images.
+
+	Returns:
+		list: One (participant, task, time, x, y, with_parameters) tuple per image.
+	"""
 	# We only want the ogama txt files as those have the x and y coordinates
 	if not 'ogama' in file_name:
-		return
+		return []
 	txt_file = os.path.join(directory_path, file_name)
 
 	path_elements = directory_path.split('/')
 	participant_id = path_elements[-1]
 
-	# Load the eye tracker data into a Pandas DataFrame
-	df = pd.read_csv(txt_file, delimiter=',', low_memory=False, on_bad_lines='skip', encoding = "utf-16")
-	df = df[[' ImageName', ' X', ' Y', ' StartTime', ' Included?', ' StimulusType']]
+	# Load the eye tracker data and remove all rows where Included? == N
+	recording = load_sharafi_recording(txt_file)
+	included = recording['Included']
+
+	# Samples without image name are one task 0.0, as missing values are filled with 0.0
+	image_names = recording['ImageName'][included].astype(object)
+	image_names[~recording['HasImage'][included]] = 0.0
+	x = fill_missing(recording['X'][included] * 1920 / 1024)
+	y = fill_missing(recording['Y'][included] * 1080 / 768)
+	time = fill_missing(recording['StartTime'][included])
 
-	df[' X'] = df[' X'] * 1920 / 1024
-	df[' Y'] = df[' Y'] * 1080 / 768
+	with instrumentation.stage('segment_sharafi', txt_file, len(image_names)):
+		# Number the images in the order they are shown first and sort the samples by image, keeping their order,
+		# so the samples of each image are one contiguous slice of the sorted arrays
+		codes, unique_image_names = pd.factorize(image_names)
+		order = np.argsort(codes, kind='stable')
+		ends = np.cumsum(np.bincount(codes, minlength=len(unique_image_names)))[:-1]
+		image_times = np.split(time[order], ends)
+		image_x = np.split(x[order], ends)
+		image_y = np.split(y[order], ends)
 
-	# Remove all rows where Included? == N
-	df = df[df[' Included?'] == 'Y']
+		segments = []
+		for index, image_name in enumerate(unique_image_names):
+			segments.append((participant_id, image_name, image_times[index], image_x[index], image_y[index], True))
 
-	df = df.fillna(0.0)
+	return segments
 
-	
-	# Iterate over all unique images
-	for image_name in df[' ImageName'].unique():
-		# Get the data for the current image
-		image_df = df[df[' ImageName'] == image_name]
 
-		# Call the defined fn
-		fn(fixation_info, participant_id, image_df[' StartTime'], image_df[' X'], image_df[' Y'], image_name, parameters)
-	
+def prepare_txt_data(directory_path, file_name, fixation_info, fn, parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
+	call_on_segments(load_txt_segments(directory_path, file_name), fixation_info, fn, parameters)
+
 
 # Define the function to prepare the eyetracking data
 ending_to_function = {
@@ -176,11 +176,134 @@ ending_to_function = {
 	'.txt': prepare_txt_data
 }
 
+# Define the function to load the eyetracking data into task segments
+ending_to_segments = {
+	'.tsv': load_tobii_segments,
+	'.txt': load_txt_segments
+}
 
-def fixation_data_analysis(directory_path, output_csv = "pygaze_fixations.csv", parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}):
 
-    # Initialize a dictionary to store the fixation counts, total fixation duration, and average fixation duration for each file
-    fixation_info = {
+def list_recordings(directory_path):
+    # List all files in the directory and subfolders that can be analysed
+    recordings = []
+    for root, dirs, files in os.walk(directory_path):
+        for file_name in files:
+            ending = os.path.splitext(file_name)[1]
+            if ending in ending_to_function:
+                recordings.append((root, file_name))
+    return recordings
+
+
+def prepare_recording(directory, file_name, info, fn, parameters):
+    # Analyse a single recording, timed as one stage when the instrumentation is enabled
+    path = os.path.join(directory, file_name)
+    with instrumentation.stage('recording', path, function=fn.__name__):
+        ending = os.path.splitext(file_name)[1]
+        ending_to_function[ending](directory, file_name, info, fn, parameters)
+
+
+def analyze_recording(directory, file_name, fn, parameters, columns):
+    # Analyse a single recording into its own info dictionary, so that recordings can run in separate processes
+    info = {column: [] for column in columns}
+    prepare_recording(directory, file_name, info, fn, parameters)
+    return info
+
+
+def recording_key(directory, file_name, fn, parameters):
+    # Results of a recording only depend on the file, the analysis function, its parameters and the analysis version
+    description = {
+        'fingerprint': cache.file_fingerprint(os.path.join(directory, file_name), cache.hash_content),
+        'function': fn.__name__,
+        'parameters': parameters,
+        'version': analysis_version,
+    }
+    return description, hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def write_json(path, data):
+    # Write to a temporary file first, so that an interrupted run never leaves a partly written file
+    temporary_file = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_file, 'w') as f:
+        json.dump(data, f, default=lambda value: value.item())
+    os.replace(temporary_file, path)
+
+
+def analyze_recordings_incremental(recordings, info, fn, parameters, workers, shard_directory):
+    # Every recording has a shard file with its rows, only recordings without a shard are analysed
+    os.makedirs(shard_directory, exist_ok=True)
+    manifest_file = os.path.join(shard_directory, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    shard_files = []
+    missing = []
+    for directory, file_name in recordings:
+        description, key = recording_key(directory, file_name, fn, parameters)
+        shard_file = os.path.join(shard_directory, f"{fn.__name__}_{key}.json")
+        shard_files.append(shard_file)
+        if not os.path.exists(shard_file):
+            missing.append((directory, file_name, description, shard_file))
+
+    def store(file_infos):
+        # The shard is written after each recording, so an interrupted run keeps its progress. Rewriting the manifest
+        # each time would take quadratic time, it is written every manifest_interval recordings and when the run stops
+        try:
+            for number, ((directory, file_name, description, shard_file), file_info) in enumerate(zip(missing, file_infos), 1):
+                write_json(shard_file, file_info)
+                manifest[os.path.basename(shard_file)] = dict(description, recording=os.path.abspath(os.path.join(directory, file_name)))
+                if number % manifest_interval == 0:
+                    write_json(manifest_file, manifest)
+        finally:
+            write_json(manifest_file, manifest)
+
+    columns = list(info.keys())
+    if workers is None or workers <= 1:
+        store(analyze_recording(directory, file_name, fn, parameters, columns) for directory, file_name, _, _ in missing)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            store(executor.map(analyze_recording,
+                               [directory for directory, _, _, _ in missing],
+                               [file_name for _, file_name, _, _ in missing],
+                               itertools.repeat(fn), itertools.repeat(parameters), itertools.repeat(columns)))
+
+    # Assemble the rows of all recordings in the order of the files
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            file_info = json.load(f)
+        for column, values in file_info.items():
+            info[column].extend(values)
+
+
+def analyze_recordings(directory_path, info, fn, parameters, workers=None, shard_directory=None):
+    recordings = list_recordings(directory_path)
+
+    if shard_directory is not None:
+        analyze_recordings_incremental(recordings, info, fn, parameters, workers, shard_directory)
+        return
+
+    # Iterate over the files in the directory
+    if workers is None or workers <= 1:
+        for directory, file_name in recordings:
+            prepare_recording(directory, file_name, info, fn, parameters)
+        return
+
+    # Fan the files out to a process pool, map returns the results in the order of the files
+    # so the merged rows are the same as in a serial run
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        file_infos = executor.map(analyze_recording,
+                                  [directory for directory, _ in recordings],
+                                  [file_name for _, file_name in recordings],
+                                  itertools.repeat(fn), itertools.repeat(parameters), itertools.repeat(list(info.keys())))
+        for file_info in file_infos:
+            for column, values in file_info.items():
+                info[column].extend(values)
+
+
+def new_fixation_info():
+    # Dictionary to store the fixation counts, total fixation duration, and average fixation duration for each task
+    return {
         'Participant': [],
         'Task': [],
         'Fixation Count': [],
@@ -189,18 +312,18 @@ def fixation_data_analysis(directory_path, output_csv = "pygaze_fixations.csv",
     }
 
 
-    # List all files in the directory and subfolders
-    file_names = {}
-    for root, dirs, files in os.walk(directory_path):
-        dir_filenames = [file_name for file_name in files]
-        file_names[root] = dir_filenames
+def fixation_data_analysis(directory_path, output_csv = "pygaze_fixations.csv", parameters = {'missing': 0.0, 'maxdist': 25, 'mindur': 50}, workers=None, shard_directory=None):
+    """
+    Parameters:
+        directory_path (str): The path to the directory containing the eye tracker data.
+        workers (int): Number of processes the recordings are distributed to, None analyses them one after another.
+        shard_directory (str): Directory keeping the results per recording, a new run only analyses new or changed
+            recordings (or changed parameters) and continues where an interrupted run stopped. None analyses all recordings.
+    """
+    # Initialize a dictionary to store the fixation counts, total fixation duration, and average fixation duration for each file
+    fixation_info = new_fixation_info()
 
-    # Iterate over the files in the directory
-    for directory, file_names in file_names.items():
-        for file_name in file_names:
-            ending = os.path.splitext(file_name)[1]
-            if ending in ending_to_function:
-                ending_to_function[ending](directory, file_name, fixation_info, call_fixation_detection_on_data, parameters)
+    analyze_recordings(directory_path, fixation_info, call_fixation_detection_on_data, parameters, workers, shard_directory)
 
     # Create a DataFrame to store the fixation information
     count_df = pd.DataFrame(fixation_info)
@@ -209,12 +332,112 @@ def fixation_data_analysis(directory_path, output_csv = "pygaze_fixations.csv",
     count_df.to_csv(output_csv, index=False)
 
     print(f"Fixation information saved to {output_csv}")
+
+
+def expand_parameter_sets(parameter_sets):
+    # A dict of lists describes a grid, every combination of its values is one parameter set
+    if isinstance(parameter_sets, dict):
+        keys = list(parameter_sets.keys())
+        values = [value if isinstance(value, (list, tuple)) else [value] for value in parameter_sets.values()]
+        return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+    return list(parameter_sets)
+
+
+def merge_sweep_results(fixation_infos, with_parameters, file_results):
+    # Append the per file results and whether their rows used the parameter sets in the order of the files
+    for file_infos, file_with_parameters in file_results:
+        with_parameters.extend(file_with_parameters)
+        for fixation_info, file_info in zip(fixation_infos, file_infos):
+            for column, values in file_info.items():
+                fixation_info[column].extend(values)
+
+
+def sweep_recording(directory, file_name, parameter_sets):
+    # Load a single recording once and analyse it with every parameter set
+    fixation_infos = [new_fixation_info() for _ in parameter_sets]
+    with instrumentation.stage('recording', os.path.join(directory, file_name), function='sweep'):
+        ending = os.path.splitext(file_name)[1]
+        segments = ending_to_segments[ending](directory, file_name)
+        for parameters, fixation_info in zip(parameter_sets, fixation_infos):
+            call_on_segments(segments, fixation_info, call_fixation_detection_on_data, parameters)
+    # Each segment is one row, the segments without parameters are analysed with default_fixation_parameters
+    return fixation_infos, [with_parameters for _, _, _, _, _, with_parameters in segments]
+
+
+def fixation_data_sweep(directory_path, parameter_sets, output_csv="pygaze_fixations_sweep.csv", workers=None):
+    """
+    Runs fixation_data_analysis for several parameter sets, but loads and splits every recording only once.
+
+    Like in fixation_data_analysis, the last task of each Tobii recording is analysed with default_fixation_parameters
+    whatever the parameter set. The long-form table holds the parameters actually used in each row and marks these
+    rows in the column Default Parameters, so they are not mistaken for results of the parameter set. The CSV files
+    per parameter set are the same as those of fixation_data_analysis and have no parameter columns.
+
+    Parameters:
+        directory_path (str): The path to the directory containing the eye tracker data.
+        parameter_sets (list or dict): A list of parameter dicts as used by fixation_data_analysis, or a dict of
+            parameter lists (e.g. {'missing': 0.0, 'maxdist': [15, 25], 'mindur': [35, 50]}) whose combinations are used.
+        output_csv (str or list): A list with one CSV path per parameter set, each written exactly like
+            fixation_data_analysis does, or a single path for one long-form table with a column per parameter
+            and the column Default Parameters.
+        workers (int): Number of processes the recordings are distributed to, None analyses them one after another.
+
+    Returns:
+        pd.DataFrame: The fixation information of all parameter sets with a column per parameter (the values used
+        for the row) and the column Default Parameters (True if the row used default_fixation_parameters instead).
+    """
+    parameter_sets = expand_parameter_sets(parameter_sets)
+    if not isinstance(output_csv, str) and len(output_csv) != len(parameter_sets):
+        raise ValueError("Expected one output file per parameter set")
+
+    fixation_infos = [new_fixation_info() for _ in parameter_sets]
+    with_parameters = []
+    recordings = list_recordings(directory_path)
+
+    # Load every file once and run all parameter sets on its segments
+    if workers is None or workers <= 1:
+        file_results = (sweep_recording(directory, file_name, parameter_sets) for directory, file_name in recordings)
+        merge_sweep_results(fixation_infos, with_parameters, file_results)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            file_results = executor.map(sweep_recording,
+                                        [directory for directory, _ in recordings],
+                                        [file_name for _, file_name in recordings],
+                                        itertools.repeat(parameter_sets))
+            merge_sweep_results(fixation_infos, with_parameters, file_results)
+
+    # The parameter columns hold the parameters each row was analysed with
+    default_rows = ~np.array(with_parameters, dtype=bool)
+    count_dfs = []
+    for parameters, fixation_info in zip(parameter_sets, fixation_infos):
+        count_df = pd.DataFrame(fixation_info)
+        for index, (key, value) in enumerate(parameters.items()):
+            values = [value] * len(count_df)
+            if key in default_fixation_parameters:
+                values = [default_fixation_parameters[key] if is_default else value for is_default in default_rows]
+            count_df.insert(index, key, values)
+        count_df.insert(len(parameters), 'Default Parameters', default_rows)
+        count_dfs.append(count_df)
+    sweep_df = pd.concat(count_dfs, ignore_index=True)
+
+    # Write either one CSV file per parameter set or one long-form CSV file
+    if isinstance(output_csv, str):
+        sweep_df.to_csv(output_csv, index=False)
+        print(f"Fixation information saved to {output_csv}")
+    else:
+        for fixation_info, path in zip(fixation_infos, output_csv):
+            pd.DataFrame(fixation_info).to_csv(path, index=False)
+            print(f"Fixation information saved to {path}")
+
+    return sweep_df
   
 
-def saccade_data_analysis(directory_path, output_csv="pygaze_saccades.csv", parameters={'missing': 0.0, 'minlen': 5, 'maxvel': 40, 'maxacc': 340}):
+def saccade_data_analysis(directory_path, output_csv="pygaze_saccades.csv", parameters={'missing': 0.0, 'minlen': 5, 'maxvel': 40, 'maxacc': 340}, workers=None, shard_directory=None):
     """
     Parameters:
         directory_path (str): The path to the directory containing the Tobii eye tracker data TSV files.
+        workers (int): Number of processes the recordings are distributed to, None analyses them one after another.
+        shard_directory (str): Directory keeping the results per recording, see fixation_data_analysis.
 
     Returns:
         pd.DataFrame: A DataFrame containing the saccade information for each file.
@@ -229,20 +452,7 @@ def saccade_data_analysis(directory_path, output_csv="pygaze_saccades.csv", para
         'Average Saccade Distance [px]': []
     }
 
-    # List all files in the directory and subfolders
-    file_names = {}
-    for root, dirs, files in os.walk(directory_path):
-        dir_filenames = [file_name for file_name in files]
-        file_names[root] = dir_filenames
-
-    # Iterate over the files in the directory
-    for directory, file_names in file_names.items():
-        for file_name in file_names:
-            ending = os.path.splitext(file_name)[1]
-            if ending in ending_to_function:
-                ending_to_function[ending](directory, file_name, saccade_info, call_saccade_detection_on_data, parameters)
-        
-            
+    analyze_recordings(directory_path, saccade_info, call_saccade_detection_on_data, parameters, workers, shard_directory)
 
     # Create a DataFrame to store the saccade information
     count_df = pd.DataFrame(saccade_info)
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from utils.cache import cached_arrays
+from utils import instrumentation
+
+# Columns of the Tobii data files that are used by the analyses and their types
+# (L Raw X [px] holds the text of the messages)
+tobii_dtypes = {
+	'Time': np.float64,
+	'Type': str,
+	'L Raw X [px]': str,
+	'R Validity': np.float64,
+	'R POR X [px]': np.float64,
+	'R POR Y [px]': np.float64,
+}
+
+# Tasks of the EMIP recordings that are not analysed
+removed_task_names = {
+	'instruction_calibration.jpg': True,
+	'instruction_comprehension.jpg': True,
+}
+
+
+def find_tobii_header(path):
+	"""Returns the number of lines before the header row of a Tobii data file, they start with ## as they are comments"""
+	with open(path, encoding='utf-8', errors='replace') as f:
+		for line_number, line in enumerate(f):
+			if line.startswith('##') or line.strip() == '':
+				continue
+			columns = line.rstrip('\r\n').split('\t')
+			missing_columns = [column for column in tobii_dtypes if column not in columns]
+			if len(missing_columns) > 0:
+				raise ValueError(f"Header of {path} in line {line_number + 1} misses the columns {missing_columns}")
+			return line_number
+	raise ValueError(f"No header found in {path}")
+
+
+def read_tobii_tsv(path):
+	# Load the Tobii eye tracker data into a Pandas DataFrame, the header is found first so the file is parsed only once
+	df = pd.read_csv(path, delimiter='\t', on_bad_lines='skip', skiprows=find_tobii_header(path), usecols=list(tobii_dtypes), dtype=tobii_dtypes)
+
+	df['Type'] = df['Type'].astype(str)
+	df = df.fillna(0.0)
+	return df
+
+
+def find_task_messages(types, messages):
+	"""
+	Finds the messages that start a task, i.e. that name an image, in one pass over the columns.
+
+	Parameters:
+		types (pd.Series): The Type column, messages have the type 'MSG'.
+		messages (pd.Series): The L Raw X [px] column, which holds the text of the messages.
+
+	Returns:
+		np.ndarray: The task names.
+		np.ndarray: The rows of the messages that start the tasks.
+	"""
+	# The columns stay pandas string columns, converting them to numpy arrays costs more than the search
+	msg_rows = np.flatnonzero((types == 'MSG').to_numpy(dtype=bool))
+	task_names = messages.iloc[msg_rows].astype(str).str.split('Message: ').str[1]
+	is_task = task_names.str.contains('.jpg', regex=False, na=False).to_numpy(dtype=bool)
+	return task_names[is_task].to_numpy(dtype=str), msg_rows[is_task].astype(np.int64)
+
+
+def parse_tobii_recording(path):
+	df = read_tobii_tsv(path)
+
+	# A task starts at each message that names an image
+	task_names, task_starts = find_task_messages(df['Type'], df['L Raw X [px]'])
+
+	return {
+		'Time': df['Time'].to_numpy(dtype=np.float64),
+		'X': df['R POR X [px]'].to_numpy(dtype=np.float64),
+		'Y': df['R POR Y [px]'].to_numpy(dtype=np.float64),
+		'Validity': df['R Validity'].to_numpy(dtype=np.int8),
+		'TaskNames': task_names,
+		'TaskStarts': task_starts,
+	}
+
+
+def load_tobii_recording(path):
+	"""
+	Loads the samples and the task segmentation of a Tobii TSV file, from the cache if it was parsed before.
+
+	Returns:
+		dict: Time (in microseconds), X and Y (right eye point of regard), Validity (right eye) per sample,
+		and TaskNames and TaskStarts (row of the message that starts the task) per task.
+	"""
+	with instrumentation.stage('load_tobii', path) as record:
+		recording = cached_arrays(path, 'tobii', parse_tobii_recording)
+		record['samples'] = len(recording['Time'])
+	return recording
+
+
+def tobii_tasks(recording):
+	"""
+	Returns a list of (task name, first row, end row, is last task) of a recording loaded by load_tobii_recording.
+	The rows before the first task belong to no task (None), if there is no task at all that is the last task.
+	"""
+	task_names = recording['TaskNames']
+	task_starts = recording['TaskStarts']
+	number_of_rows = len(recording['Time'])
+
+	tasks = [(None, 0, int(task_starts[0]) if len(task_starts) > 0 else number_of_rows, len(task_starts) == 0)]
+	for index in range(len(task_starts)):
+		end = int(task_starts[index + 1]) if index + 1 < len(task_starts) else number_of_rows
+		tasks.append((str(task_names[index]), int(task_starts[index]), end, index + 1 == len(task_starts)))
+	return tasks
+
+
+def numeric_array(column):
+	# Whole numbers stay int64 like pandas reads them, other columns become float64, object arrays can not be cached
+	column = pd.to_numeric(column)
+	if pd.api.types.is_integer_dtype(column):
+		return column.to_numpy(dtype=np.int64)
+	return column.to_numpy(dtype=np.float64)
+
+
+def parse_sharafi_recording(path):
+	# Load the eye tracker data into a Pandas DataFrame
+	df = pd.read_csv(path, delimiter=',', low_memory=False, on_bad_lines='skip', encoding = "utf-16")
+
+	# Missing image names are masked, as a string array would turn them into 'nan'
+	has_image = df[' ImageName'].notna()
+
+	return {
+		'ImageName': df[' ImageName'].fillna('').to_numpy(dtype=str),
+		'HasImage': has_image.to_numpy(dtype=bool),
+		'X': df[' X'].to_numpy(dtype=np.float64),
+		'Y': df[' Y'].to_numpy(dtype=np.float64),
+		'StartTime': numeric_array(df[' StartTime']),
+		'Duration': numeric_array(df[' Duration']),
+		'Included': (df[' Included?'] == 'Y').to_numpy(),
+	}
+
+
+def load_sharafi_recording(path):
+	"""
+	Loads the samples of an ogama txt file of Sharafi et al., from the cache if it was parsed before.
+
+	Returns:
+		dict: ImageName ('' if missing), HasImage, X, Y (in 1024x768 screen coordinates), StartTime, Duration and
+		Included per sample.
+	"""
+	with instrumentation.stage('load_sharafi', path) as record:
+		recording = cached_arrays(path, 'sharafi', parse_sharafi_recording)
+		record['samples'] = len(recording['X'])
+	return recording
@@ -0,0 +1,222 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from utils import cache
+
+# Generators of the snippets and fonts like in the RQ1 notebooks, the font path is passed to GenSnippetsLib unchanged
+generator_directory = "../data/StudyPeitek/CodeSnippets/Generators_Labeled/Generators/"
+default_font_path = "/../data/StudyPeitek/CodeSnippets/fonts/ttf/"
+# The snippets are shown in the middle of the screen
+screen_size = (1920, 1080)
+
+# Columns of the tables of each kind of box, like in the RQ1 notebooks
+table_columns = {
+	"token": ["Algorithm", "Token", "TokenIdx", "BoundingBox"],
+	"aoi": ["Algorithm", "AOI", "AOIIdx", "BoundingBox"],
+	"line": ["Algorithm", "Line", "BoundingBox"],
+}
+
+
+def cluster_tokens(aoi_list):
+	"""
+	Joins the consecutive letters with the same token AOI into one box.
+
+	Returns:
+		list: (index, token, left, top, right, bottom) per token.
+	"""
+	aoi_clustered = []
+	current_aoi = None
+	for letter in aoi_list:
+		# Letters without token and new lines end the present token
+		if len(letter["AOI"]) == 1 or letter["letter"] == '\n':
+			if current_aoi is not None:
+				aoi_clustered.append((len(aoi_clustered), current_aoi, left, top, right, bottom))
+			current_aoi = None
+			continue
+		if current_aoi == letter["AOI"][1]:
+			left = min(left, letter["BoundingBox"][0])
+			top = min(top, letter["BoundingBox"][1])
+			right = max(right, letter["BoundingBox"][2])
+			bottom = max(bottom, letter["BoundingBox"][3])
+			continue
+		if current_aoi is not None:
+			aoi_clustered.append((len(aoi_clustered), current_aoi, left, top, right, bottom))
+		current_aoi = letter["AOI"][1]
+		left, top, right, bottom = letter["BoundingBox"][:4]
+	return aoi_clustered
+
+
+def cluster_aois(aoi_list):
+	"""
+	Joins the letters of each (possibly nested) AOI into one box, white space is skipped.
+
+	Returns:
+		list: (index, AOI, left, top, right, bottom) per AOI, in the order the AOIs are closed.
+	"""
+	aoi_clustered = []
+	# The open AOIs, each as [AOI, left, top, right, bottom]
+	current = []
+	for letter in aoi_list:
+		if letter['letter'] in " \t\n":
+			continue
+		# The AOIs of the letter, the first entry is not an AOI
+		aois = list(letter["AOI"])
+		if len(aois) == 1:
+			# Close all AOIs
+			aoi_clustered.extend([(len(aoi_clustered) + idx,) + tuple(aoi) for idx, aoi in enumerate(current)])
+			current = []
+			continue
+
+		# Grow the open AOIs the letter belongs to and close the other ones, the open AOIs are visited from the last one
+		if len(current) > 0:
+			for idx in reversed(range(len(current))):
+				if current[idx][0] in aois:
+					current[idx][1] = min(current[idx][1], letter["BoundingBox"][0])
+					current[idx][2] = min(current[idx][2], letter["BoundingBox"][1])
+					current[idx][3] = max(current[idx][3], letter["BoundingBox"][2])
+					current[idx][4] = max(current[idx][4], letter["BoundingBox"][3])
+					aois.remove(current[idx][0])
+				else:
+					aoi_clustered.append((len(aoi_clustered),) + tuple(current[idx]))
+					del current[idx]
+
+		# Open the AOIs that start with the letter
+		for aoi in aois[1:]:
+			current.append([aoi] + list(letter["BoundingBox"][:4]))
+
+	aoi_clustered.extend([(len(aoi_clustered) + idx,) + tuple(aoi) for idx, aoi in enumerate(current)])
+	return aoi_clustered
+
+
+def cluster_lines(aoi_list):
+	"""
+	Joins the letters of each line into one box, empty lines have no box.
+
+	Returns:
+		list: (line, left, top, right, bottom) per line.
+	"""
+	aoi_clustered = []
+	current_line = 0
+	left = None
+	for letter in aoi_list:
+		if letter["letter"] == '\n':
+			if left is not None:
+				aoi_clustered.append((current_line, left, top, right, bottom))
+			left = None
+			current_line += 1
+			continue
+		if left is None:
+			left, top, right, bottom = letter["BoundingBox"][:4]
+		else:
+			left = min(left, letter["BoundingBox"][0])
+			top = min(top, letter["BoundingBox"][1])
+			right = max(right, letter["BoundingBox"][2])
+			bottom = max(bottom, letter["BoundingBox"][3])
+	return aoi_clustered
+
+
+def font_directory(font_path):
+	# GenSnippetsLib gets the font path relative to the working directory with a leading slash
+	if os.path.isdir(font_path):
+		return font_path
+	return os.getcwd() + font_path
+
+
+def font_hash(font_path=default_font_path):
+	"""Returns a hex digest of the names and contents of the font files, so changed fonts are rendered again"""
+	digest = hashlib.sha1()
+	directory = font_directory(font_path)
+	for name in sorted(os.listdir(directory)):
+		path = os.path.join(directory, name)
+		if os.path.isfile(path):
+			digest.update(name.encode())
+			digest.update(cache.file_fingerprint(path, content=True).encode())
+	return digest.hexdigest()
+
+
+def render_geometry(generator_path, font_path=default_font_path):
+	"""
+	Renders the snippet once and clusters its letters into tokens, AOIs and lines.
+
+	Returns:
+		dict: The arrays Kind, Index, Name and BoundingBox (left, top, right, bottom on the screen) with one entry
+		per box, and the ImageSize and Offset of the snippet on the screen.
+	"""
+	# GenSnippetsLib is part of the data of Peitek et al., its dataEvaluation folder has to be in sys.path
+	import utils.GenSnippetsLib as gsl
+
+	image, aoi_list = gsl.create_image(generator_path, font_path=font_path)
+	width, height = image.size
+	offset = (int(screen_size[0] * 0.5) - int(width / 2), int(screen_size[1] * 0.5) - int(height / 2))
+
+	kinds = []
+	indices = []
+	names = []
+	boxes = []
+	for kind, clustered in [("token", cluster_tokens(aoi_list)), ("aoi", cluster_aois(aoi_list))]:
+		for idx, name, left, top, right, bottom in clustered:
+			kinds.append(kind)
+			indices.append(idx)
+			names.append(str(name))
+			boxes.append((left, top, right, bottom))
+	for line, left, top, right, bottom in cluster_lines(aoi_list):
+		kinds.append("line")
+		indices.append(line)
+		names.append("")
+		boxes.append((left, top, right, bottom))
+
+	# Whole pixels stay integers like the boxes of GenSnippetsLib
+	boxes = np.asarray(boxes).reshape(-1, 4) + np.tile(offset, 2)
+	return {
+		"Kind": np.asarray(kinds, dtype=str),
+		"Index": np.asarray(indices, dtype=np.int64),
+		"Name": np.asarray(names, dtype=str),
+		"BoundingBox": boxes,
+		"ImageSize": np.asarray([width, height], dtype=np.int64),
+		"Offset": np.asarray(offset, dtype=np.int64),
+	}
+
+
+# Rendering is slow, so the boxes are stored once per generator file and set of fonts in the cache of utils.cache
+# and shared by the RQ1 notebooks of all tools
+def snippet_geometry(generator_path, font_path=default_font_path, fonts=None):
+	"""
+	Returns the arrays of render_geometry, the snippet is only rendered if the generator or the fonts changed.
+	fonts is the font_hash of the font path, it is computed if it is None.
+	"""
+	if fonts is None:
+		fonts = font_hash(font_path)
+	kind = f"geometry_{fonts[:16]}"
+	return cache.cached_arrays(generator_path, kind, lambda path: render_geometry(path, font_path))
+
+
+def geometry_table(snippets, kind, suffix="", font_path=default_font_path):
+	"""
+	Returns the boxes of one kind of all snippets as table like in the RQ1 notebooks.
+
+	Parameters:
+		snippets (list): Names of the snippets, e.g. df_fixation["Algorithm"].unique().
+		kind (str): "token", "aoi" or "line".
+		suffix (str): Suffix of the generator file, e.g. "_ast" for the token generators.
+		font_path (str): Font path passed to GenSnippetsLib.
+
+	Returns:
+		pd.DataFrame: One row per box with the columns of table_columns, the bounding box is a tuple.
+	"""
+	columns = table_columns[kind]
+	fonts = font_hash(font_path)
+	tables = []
+	for snippet in snippets:
+		geometry = snippet_geometry(os.path.join(generator_directory, f"{snippet}{suffix}.json"), font_path, fonts)
+		rows = geometry["Kind"] == kind
+		table = {"Algorithm": np.full(rows.sum(), snippet, dtype=object)}
+		if kind != "line":
+			table[columns[1]] = geometry["Name"][rows].astype(object)
+		table[columns[-2]] = geometry["Index"][rows]
+		table["BoundingBox"] = [tuple(box) for box in geometry["BoundingBox"][rows].tolist()]
+		tables.append(pd.DataFrame(table, columns=columns))
+
+	if len(tables) == 0:
+		return pd.DataFrame(columns=columns)
+	return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+# Token based reading metrics of the RQ1 notebooks, computed with grouped array operations instead of row loops
+metric_columns = ["FirstFixationDuration", "SingleFixationDuration", "GazeDuration", "TotalTime",
+				"TokenNoFixationProbability", "TokenSingleFixationProbability", "TokenMultipleFixationProbability",
+				"TokenFixationProbability"]
+
+
+def segment_sums(values, starts, lengths):
+	# Sum of each segment from left to right, like the sum of a list
+	sums = np.zeros(len(starts), dtype=np.float64)
+	for position in range(int(lengths.max(initial=0))):
+		in_segment = position < lengths
+		if position == 0:
+			sums[in_segment] = values[starts[in_segment]]
+		else:
+			sums[in_segment] += values[starts[in_segment] + position]
+	return sums
+
+
+def fixation_runs(df_fixations, drop_last_run=False):
+	"""
+	Splits the fixations into runs, consecutive fixations of a participant on the same token of a snippet.
+
+	Parameters:
+		df_fixations (pd.DataFrame): One row per fixation on a token with the columns Algorithm, Participant and
+			TokenIdx, the fixations of a participant on a snippet in their order.
+		drop_last_run (bool): Ignore the last run of the table like the loops of the RQ1 notebooks.
+
+	Returns:
+		np.ndarray: The positions of the fixations that are kept.
+		pd.DataFrame: One row per run with the columns Algorithm, Participant and TokenIdx.
+		np.ndarray: The position of the first fixation of each run among the kept fixations.
+		np.ndarray: The number of fixations of each run.
+		np.ndarray: Whether the run is the first pass of the participant on the token.
+	"""
+	algorithms = df_fixations["Algorithm"].to_numpy()
+	participants = df_fixations["Participant"].to_numpy()
+	tokens = df_fixations["TokenIdx"].to_numpy()
+	kept = np.arange(len(tokens))
+
+	# A run starts where the participant, snippet or token changes
+	run_start = np.ones(len(tokens), dtype=bool)
+	run_start[1:] = (participants[1:] != participants[:-1]) | (algorithms[1:] != algorithms[:-1]) | (tokens[1:] != tokens[:-1])
+	if drop_last_run and len(tokens) > 0:
+		keep = np.cumsum(run_start) < run_start.sum()
+		algorithms, participants, tokens, run_start, kept = algorithms[keep], participants[keep], tokens[keep], run_start[keep], kept[keep]
+
+	# The first run of a participant on a token is its first pass
+	starts = np.flatnonzero(run_start)
+	lengths = np.diff(np.append(starts, len(tokens)))
+	df_runs = pd.DataFrame({"Algorithm": algorithms[starts], "Participant": participants[starts], "TokenIdx": tokens[starts]})
+	first_pass = df_runs.groupby(["Participant", "Algorithm", "TokenIdx"], sort=False).cumcount().to_numpy() == 0
+	return kept, df_runs, starts, lengths, first_pass
+
+
+def token_fixations(df_fixations, drop_last_run=False):
+	"""
+	Sums up the fixations of each participant on each token into its first pass and its refixations.
+
+	Parameters:
+		df_fixations (pd.DataFrame): One row per fixation on a token with the columns Algorithm, Participant,
+			FixationDuration and TokenIdx, the fixations of a participant on a snippet in their order.
+		drop_last_run (bool): Ignore the last run of the table like the loops of the RQ1 notebooks.
+
+	Returns:
+		pd.DataFrame: One row per participant, snippet and fixated token with the number of fixations of the
+		first pass (FirstPassFixations) and of the refixations (ReFixations), the duration of the first fixation
+		(FirstFixationDuration), the sum of the first pass (GazeDuration) and of all fixations (TotalTime).
+	"""
+	kept, df_runs, starts, lengths, first_pass = fixation_runs(df_fixations, drop_last_run)
+	durations = df_fixations["FixationDuration"].to_numpy(dtype=np.float64)[kept]
+
+	df_tokens = df_runs[first_pass].reset_index(drop=True)
+	df_tokens["FirstPassFixations"] = lengths[first_pass]
+	df_tokens["FirstFixationDuration"] = durations[starts[first_pass]]
+	df_tokens["GazeDuration"] = segment_sums(durations, starts[first_pass], lengths[first_pass])
+
+	# The fixations of each token in their order, the first pass is followed by the refixations
+	run_token = np.repeat(df_runs.groupby(["Participant", "Algorithm", "TokenIdx"], sort=False).ngroup().to_numpy(), lengths)
+	order = np.argsort(run_token, kind="stable")
+	token_starts = np.searchsorted(run_token[order], np.arange(len(df_tokens)))
+	token_lengths = np.bincount(run_token, minlength=len(df_tokens))
+	df_tokens["ReFixations"] = token_lengths - df_tokens["FirstPassFixations"].to_numpy()
+	df_tokens["TotalTime"] = segment_sums(durations[order], token_starts, token_lengths)
+	return df_tokens
+
+
+def token_fixation_lists(df_fixations, df_tokens, participants, drop_last_run=False):
+	"""
+	Returns the durations of the fixations on each token in the layout of token_fixations.csv of the RQ1 notebooks.
+
+	Parameters:
+		df_fixations (pd.DataFrame): The fixations on the tokens, see token_fixations.
+		df_tokens (pd.DataFrame): One row per token with the columns Algorithm and TokenIdx, the columns Token and
+			BoundingBox are left out.
+		participants (list): The participants, each one gets a column of first pass and of refixation durations.
+		drop_last_run (bool): Ignore the last run of the fixations like the loops of the RQ1 notebooks.
+
+	Returns:
+		pd.DataFrame: The columns of df_tokens and per participant the columns TokenFixation_P<participant> (list of
+		the durations of the first pass) and TokenReFixation_P<participant> (list of the durations of all later runs).
+	"""
+	kept, df_runs, starts, lengths, first_pass = fixation_runs(df_fixations, drop_last_run)
+	durations = df_fixations["FixationDuration"].to_numpy()[kept].tolist()
+
+	# Durations of the first pass and of the refixations of each participant on each token
+	first = {}
+	refixations = {}
+	for key, start, length, is_first in zip(df_runs.itertuples(index=False, name=None), starts.tolist(), lengths.tolist(), first_pass.tolist()):
+		if is_first:
+			first[key] = durations[start:start + length]
+		else:
+			refixations.setdefault(key, []).extend(durations[start:start + length])
+
+	df_table = df_tokens.drop(columns=["Token", "BoundingBox"], errors="ignore")
+	tokens = list(zip(df_table["Algorithm"].tolist(), df_table["TokenIdx"].tolist()))
+	columns = {}
+	for participant in participants:
+		columns[f"TokenFixation_P{participant}"] = [list(first.get((algorithm, participant, token), [])) for algorithm, token in tokens]
+		columns[f"TokenReFixation_P{participant}"] = [list(refixations.get((algorithm, participant, token), [])) for algorithm, token in tokens]
+	return pd.concat([df_table, pd.DataFrame(columns, index=df_table.index)], axis=1)
+
+
+def token_metrics(df_fixations, df_tokens, participants, df_skill=None, drop_last_run=False):
+	"""
+	Computes the token based metrics of each participant like the RQ1 notebooks.
+
+	The durations are averaged over the tokens a participant fixated. The probabilities are the share of the tokens
+	of a snippet that were not fixated, fixated once, fixated again later and fixated at all, averaged over the
+	snippets where the share is not 0.
+
+	Parameters:
+		df_fixations (pd.DataFrame): The fixations on the tokens, see token_fixations.
+		df_tokens (pd.DataFrame): One row per token with the columns Algorithm and TokenIdx.
+		participants (list): The participants, the ones without fixations on a snippet skipped all of its tokens.
+		df_skill (pd.DataFrame): Participant and SkillScore, None leaves out the Skill column.
+		drop_last_run (bool): Ignore the last run of the fixations like the loops of the RQ1 notebooks.
+
+	Returns:
+		pd.DataFrame: One row per participant (sorted) with the columns of metric_columns and Skill.
+	"""
+	fixated = token_fixations(df_fixations, drop_last_run).set_index(["Participant", "Algorithm", "TokenIdx"])
+
+	# One row for each participant and token, the participants one after another like the melted table of the notebooks
+	token_algorithms = df_tokens["Algorithm"].to_numpy()
+	token_indices = df_tokens["TokenIdx"].to_numpy()
+	df = pd.DataFrame({
+		"Participant": np.repeat(np.asarray(participants), len(df_tokens)),
+		"Algorithm": np.tile(token_algorithms, len(participants)),
+		"TokenIdx": np.tile(token_indices, len(participants)),
+	})
+	values = fixated.reindex(pd.MultiIndex.from_frame(df))
+	first_pass = values["FirstPassFixations"].fillna(0).to_numpy()
+	refixations = values["ReFixations"].fillna(0).to_numpy()
+	total_time = values["TotalTime"].fillna(0).to_numpy()
+	df["FirstFixationDuration"] = np.where(first_pass > 0, values["FirstFixationDuration"].to_numpy(), np.nan)
+	df["SingleFixationDuration"] = np.where(first_pass == 1, values["FirstFixationDuration"].to_numpy(), np.nan)
+	df["GazeDuration"] = np.where(first_pass > 0, values["GazeDuration"].to_numpy(), np.nan)
+	df["TotalTime"] = np.where(total_time != 0, total_time, np.nan)
+
+	# Means of the durations over the fixated tokens
+	participant_index = pd.Index(np.sort(pd.unique(np.asarray(participants))), name="Participant")
+	metrics = pd.DataFrame(index=participant_index)
+	for column in ["FirstFixationDuration", "SingleFixationDuration", "GazeDuration"]:
+		metrics[column] = df.groupby("Participant")[column].mean()
+
+	# The notebooks have the total time (and skill) of each token twice, once for the first pass and once for the
+	# refixations, repeating it keeps the order of the sums and so the same values
+	rows = np.arange(len(df)).reshape(len(participants), len(df_tokens))
+	doubled = df.iloc[np.concatenate([rows, rows], axis=1).ravel()]
+	if df_skill is not None:
+		doubled = doubled.merge(df_skill[["Participant", "SkillScore"]].drop_duplicates(), on="Participant", how="left")
+	metrics["TotalTime"] = doubled.groupby("Participant")["TotalTime"].mean()
+
+	# Share of the tokens of each snippet, the snippets without such tokens are left out of the mean
+	number_of_tokens = df_tokens.groupby("Algorithm")["TokenIdx"].max() + 1
+	kinds = {
+		"TokenNoFixationProbability": first_pass == 0,
+		"TokenSingleFixationProbability": (first_pass == 1) & (refixations == 0),
+		"TokenMultipleFixationProbability": (first_pass >= 1) & (refixations > 0),
+		"TokenFixationProbability": first_pass >= 1,
+	}
+	for column, selected in kinds.items():
+		counts = df[selected].groupby(["Participant", "Algorithm"]).size()
+		probability = counts / number_of_tokens.reindex(counts.index.get_level_values("Algorithm")).to_numpy()
+		metrics[column] = probability.groupby("Participant").mean().reindex(participant_index, fill_value=0)
+
+	if df_skill is not None:
+		metrics["Skill"] = doubled.groupby("Participant")["SkillScore"].mean()
+	return metrics.reset_index(drop=True)